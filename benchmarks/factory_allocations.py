@@ -0,0 +1,68 @@
+#!/usr/bin/python
+"""
+Compares the number of factories and mappers allocated per panel when
+factories are shared through the registry and when they are built for
+every item, as they used to be.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dashbuilder import factory
+from dashbuilder import mapper
+
+
+def synthetic_dashboard(panels):
+    return {'form': {'rows': [{'panels': [
+        {'title': 'panel {}'.format(i),
+         'items': [{'chart': {'options': {'charting.chart': 'line'},
+                              'search': {'query': 'index=main {}'.format(i)}}}]}
+        for i in xrange(panels)]}]}}
+
+
+class Counter(object):
+    def __init__(self):
+        self.count = 0
+
+    def wrap(self, cls):
+        init = cls.__init__
+
+        def counting_init(instance, *args, **kwargs):
+            self.count += 1
+            init(instance, *args, **kwargs)
+
+        cls.__init__ = counting_init
+
+
+def measure(registry, data, panels, counter):
+    factory.REGISTRY = registry
+    counter.count = 0
+    start = time.time()
+    factory.create(data)
+    elapsed = time.time() - start
+    return float(counter.count) / panels, elapsed
+
+
+def main():
+    panels = 1000
+    data = synthetic_dashboard(panels)
+
+    counter = Counter()
+    counter.wrap(factory.BaseFactory)
+    counter.wrap(mapper.Mapper)
+    counter.wrap(mapper.GenericMapper)
+
+    shared = factory.Registry()
+    factory.REGISTRY = shared
+    factory.create(data)
+
+    for name, registry in [('per item (before)', factory.Registry(shared=False)),
+                           ('shared (after)', shared)]:
+        allocations, elapsed = measure(registry, data, panels, counter)
+        print "{:<20} {:>8.1f} allocations/panel {:>8.3f}s".format(name, allocations, elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/python
+"""
+Compares the single-pass indenting serializer with the minidom round trip
+previously used by pretty_xml, on synthetic dashboards.
+"""
+import os
+import sys
+import time
+import xml.dom.minidom as minidom
+import xml.etree.ElementTree as ETtree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dashbuilder import factory
+from dashbuilder import writer
+
+
+def synthetic_dashboard(panels, panels_per_row=4):
+    rows = []
+    for r in xrange(0, panels, panels_per_row):
+        rows.append({'panels': [
+            {'title': 'panel {}'.format(i),
+             'items': [{'chart': {'options': {'charting.chart': 'line'},
+                                  'search': {'query': 'index=main host={} | timechart count'.format(i),
+                                             'earliest': '-24h',
+                                             'latest': 'now'}}}]}
+            for i in xrange(r, min(r + panels_per_row, panels))]})
+    return {'form': {'label': 'Benchmark', 'rows': rows}}
+
+
+def minidom_pretty_xml(data):
+    rough_string = ETtree.tostring(data, 'utf-8')
+    reparsed = minidom.parseString(rough_string)
+    return reparsed.toprettyxml(indent="  ").encode('utf-8')
+
+
+def timed(fn, *args):
+    start = time.time()
+    result = fn(*args)
+    return result, time.time() - start
+
+
+def main():
+    for panels in (10, 1000, 50000):
+        dashboard = factory.create(synthetic_dashboard(panels))
+
+        expected, minidom_time = timed(minidom_pretty_xml, dashboard)
+        actual, writer_time = timed(writer.tostring, dashboard)
+
+        print "{:>6} panels  minidom {:>8.3f}s  writer {:>8.3f}s  same output: {}".format(
+            panels, minidom_time, writer_time, expected == actual)
+
+
+if __name__ == '__main__':
+    main()
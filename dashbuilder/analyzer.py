@@ -0,0 +1,238 @@
+import re
+import types
+
+
+class Tags(object):
+    Fieldset = "fieldset"
+    Items = "items"
+    Rows = "rows"
+    Panels = "panels"
+    Search = "search"
+    Searches = "searches"
+    Token = "token"
+    Change = "change"
+    Conditions = "conditions"
+    Set = "set"
+    Value = "value"
+    Default = "default"
+    Depends = "depends"
+    Rejects = "rejects"
+    Time = "time"
+    Base = "base"
+
+
+TOKEN_RE = re.compile(r"\$([^\$\s]+)\$")
+
+# Tokens set by Splunk itself rather than by the dashboard inputs
+PREDEFINED_TOKEN_PREFIXES = ("env:", "click.", "row.", "result.", "job.")
+
+
+def find_tokens(value):
+    if not isinstance(value, basestring):
+        return set()
+    return set(TOKEN_RE.findall(value))
+
+
+def is_predefined(token):
+    return token.startswith(PREDEFINED_TOKEN_PREFIXES)
+
+
+def input_tokens(t, data):
+    """
+    Returns the tokens set by an input.
+    """
+    token = data.get(Tags.Token)
+    if t == Tags.Time:
+        # Time inputs without a token set the default time range of the
+        # dashboard
+        if token is None:
+            return set(["earliest", "latest"])
+        return set([token + ".earliest", token + ".latest"])
+
+    return set() if token is None else set([token])
+
+
+def condition_tokens(condition):
+    assignments = condition.get(Tags.Set, {})
+    if isinstance(assignments, dict):
+        assignments = assignments.items()
+    return set(name for name, _ in assignments)
+
+
+class Input(object):
+    """
+    An input with the tokens it sets, and the tokens set by each condition
+    of its change handler. Only one condition matches a change, and the
+    one matching the default value is applied on load.
+    """
+    def __init__(self, t, data):
+        self.tokens = input_tokens(t, data)
+        conditions = (data.get(Tags.Change) or {}).get(Tags.Conditions, [])
+        self.alternatives = [condition_tokens(condition) for condition in conditions]
+        self.initial = set()
+        for condition in conditions:
+            if Tags.Default in data and condition.get(Tags.Value) == data[Tags.Default]:
+                self.initial = condition_tokens(condition)
+                break
+
+    def provided(self):
+        tokens = set(self.tokens)
+        for alternative in self.alternatives:
+            tokens.update(alternative)
+        return tokens
+
+    def changes(self):
+        """
+        Returns the sets of tokens set by one change of the input.
+        """
+        if not self.alternatives:
+            return [self.tokens]
+        return [self.tokens | alternative for alternative in self.alternatives]
+
+
+def gating_tokens(data):
+    return find_tokens(data.get(Tags.Depends))
+
+
+def rejecting_tokens(data):
+    return find_tokens(data.get(Tags.Rejects))
+
+
+def search_tokens(search):
+    tokens = set()
+    for value in search.itervalues():
+        tokens.update(find_tokens(value))
+    return tokens
+
+
+class Search(object):
+    """
+    A search waiting for tokens to be set, and stopped while any of its
+    rejected tokens is set.
+    """
+    def __init__(self, location, tokens, rejects=frozenset()):
+        self.location = location
+        self.tokens = tokens
+        self.rejects = rejects
+
+
+def is_job(search):
+    # Post-process searches run on the results of their base search
+    return isinstance(search, dict) and Tags.Base not in search
+
+
+def as_list(items):
+    if isinstance(items, (list, types.GeneratorType)):
+        return list(items)
+    return [items]
+
+
+def iter_searches(dashboard):
+    """
+    Yields every search of the dashboard starting a job, with its location,
+    the tokens it waits for, including those of depends on its containers,
+    and the tokens rejected by its containers.
+    """
+    if is_job(dashboard.get(Tags.Search)):
+        search = dashboard[Tags.Search]
+        yield Search("search", search_tokens(search))
+
+    for i, search in enumerate(dashboard.get(Tags.Searches, [])):
+        if is_job(search):
+            yield Search("searches[{}]".format(i), search_tokens(search))
+
+    for r, row in enumerate(as_list(dashboard.get(Tags.Rows, []))):
+        row_tokens = gating_tokens(row)
+        row_rejects = rejecting_tokens(row)
+        for p, panel in enumerate(as_list(row.get(Tags.Panels, []))):
+            location = "rows[{}].panels[{}]".format(r, p)
+            panel_tokens = row_tokens | gating_tokens(panel)
+            panel_rejects = row_rejects | rejecting_tokens(panel)
+
+            if is_job(panel.get(Tags.Search)):
+                yield Search(location + ".search",
+                             panel_tokens | search_tokens(panel[Tags.Search]),
+                             panel_rejects)
+
+            for i, item in enumerate(as_list(panel.get(Tags.Items, []))):
+                for t, visualization in item.iteritems():
+                    if not isinstance(visualization, dict):
+                        continue
+                    search = visualization.get(Tags.Search)
+                    if is_job(search):
+                        yield Search("{}.items[{}].{}.search".format(location, i, t),
+                                     panel_tokens |
+                                     gating_tokens(visualization) |
+                                     search_tokens(search),
+                                     panel_rejects | rejecting_tokens(visualization))
+
+
+def iter_inputs(dashboard):
+    fieldset = dashboard.get(Tags.Fieldset) or {}
+    for i, item in enumerate(as_list(fieldset.get(Tags.Items, []))):
+        for t, data in item.iteritems():
+            name = data.get(Tags.Token) or "{}[{}]".format(t, i)
+            yield name, Input(t, data)
+
+
+def analyze(data):
+    """
+    Builds the graph of tokens set by the inputs of a parsed dashboard and
+    consumed by its searches. Returns a report listing unresolved tokens and
+    the number of searches started on load and by each input change.
+    """
+    dashboard = data.values()[0]
+
+    inputs = dict(iter_inputs(dashboard))
+    provided = set()
+    # Tokens of change conditions are only set on load by the condition
+    # matching the default value of their input
+    pending = set()
+    for i in inputs.itervalues():
+        provided.update(i.provided())
+        pending.update(i.provided() - i.tokens - i.initial)
+
+    searches = list(iter_searches(dashboard))
+
+    unresolved = []
+    consumers = {}
+    blocked = set()
+    for search in searches:
+        for token in sorted(search.tokens | search.rejects):
+            rejected = token not in search.tokens
+            if token.startswith("form."):
+                token = token[len("form."):]
+            if is_predefined(token):
+                continue
+            # Rejected tokens stop searches when set: they can stay unset
+            if token not in provided and not rejected:
+                unresolved.append({"token": token, "search": search.location})
+                blocked.add(search.location)
+            if token in pending and not rejected:
+                blocked.add(search.location)
+            consumers.setdefault(token, []).append(search.location)
+
+    triggers = {}
+    for name, i in sorted(inputs.iteritems()):
+        searches_per_change = []
+        for tokens in i.changes():
+            triggered = set()
+            for token in tokens:
+                triggered.update(consumers.get(token, []))
+            searches_per_change.append(len(triggered))
+        triggers[name] = {"tokens": sorted(i.provided()),
+                          "searches": max(searches_per_change)}
+
+    on_load = len([search for search in searches
+                   if search.location not in blocked])
+
+    return {
+        "searches": len(searches),
+        "tokens": dict((token, sorted(locations))
+                       for token, locations in consumers.iteritems()),
+        "unresolved": unresolved,
+        "inputs": triggers,
+        "on_load": on_load,
+        "max_concurrent_searches": max(
+            [on_load] + [trigger["searches"] for trigger in triggers.itervalues()])
+    }
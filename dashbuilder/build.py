@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+
+MANIFEST = "manifest.json"
+YAML_EXTENSIONS = (".yaml", ".yml")
+
+
+def content_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def file_hash(path):
+    with open(path, 'rb') as fp:
+        return content_hash(fp.read())
+
+
+def tool_version():
+    """
+    Returns a hash of the sources of the tool, so that outputs are rebuilt
+    whenever the generator itself changes.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".py"):
+            with open(os.path.join(directory, name), 'rb') as fp:
+                digest.update(name)
+                digest.update(fp.read())
+    return digest.hexdigest()
+
+
+def settings_hash(settings):
+    return content_hash(json.dumps(settings, sort_keys=True))
+
+
+def find_dashboards(source_dir):
+    for root, _, files in os.walk(source_dir):
+        for name in sorted(files):
+            if name.endswith(YAML_EXTENSIONS):
+                yield os.path.relpath(os.path.join(root, name), source_dir)
+
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST)) as fp:
+            return json.load(fp)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_manifest(output_dir, manifest):
+    with open(os.path.join(output_dir, MANIFEST), 'w') as fp:
+        json.dump(manifest, fp, indent=2, sort_keys=True)
+
+
+def output_path(output_dir, dashboard):
+    return os.path.join(output_dir, os.path.splitext(dashboard)[0] + ".xml")
+
+
+def is_up_to_date(entry, input_hash, path):
+    return (entry is not None and
+            entry["input"] == input_hash and
+            os.path.exists(path) and
+            file_hash(path) == entry["output"])
+
+
+def build_directory(source_dir, output_dir, render, force=False, settings=None):
+    """
+    Renders every yaml dashboard found in source_dir to an xml file in
+    output_dir, skipping dashboards whose input, output, tool version and
+    settings match the manifest of the previous build. settings holds the
+    options changing the output of render, as json serializable values.
+    Outputs of dashboards removed from source_dir since the previous build
+    are deleted.
+    """
+    version = tool_version()
+    settings = settings_hash(settings or {})
+    manifest = load_manifest(output_dir)
+    recorded = manifest.get("dashboards", {})
+    previous = recorded
+    if manifest.get("tool_version") != version or manifest.get("settings") != settings:
+        previous = {}
+
+    dashboards = {}
+    report = {"built": [], "skipped": [], "removed": []}
+
+    try:
+        for dashboard in find_dashboards(source_dir):
+            input_hash = file_hash(os.path.join(source_dir, dashboard))
+            path = output_path(output_dir, dashboard)
+            entry = previous.get(dashboard)
+
+            if not force and is_up_to_date(entry, input_hash, path):
+                dashboards[dashboard] = entry
+                report["skipped"].append(dashboard)
+                continue
+
+            xml = render(os.path.join(source_dir, dashboard))
+
+            directory = os.path.dirname(path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(path, 'wb') as fp:
+                fp.write(xml)
+
+            dashboards[dashboard] = {"input": input_hash,
+                                     "output": content_hash(xml)}
+            report["built"].append(dashboard)
+
+        for dashboard in sorted(set(recorded) - set(dashboards)):
+            path = output_path(output_dir, dashboard)
+            if os.path.exists(path):
+                os.remove(path)
+            report["removed"].append(dashboard)
+    finally:
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        save_manifest(output_dir, {"tool_version": version,
+                                   "settings": settings,
+                                   "dashboards": dashboards})
+
+    return report
@@ -1,15 +1,29 @@
 #!/usr/bin/python
-import yaml
 import json
 import argparse
-import xml.dom.minidom as minidom
+import collections
+import copy
+import glob
+import functools
+import itertools
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import xml.etree.ElementTree as ETtree
 import os
 import sys
 
+import analyzer
+import build
 import factory
+import layout
+import loader
+import optimizer
 import splunk
+import writer
 import parser
+import planner
+import policy
+import publisher
 
 
 def dump(data):
@@ -20,9 +34,7 @@ def pretty_xml(data):
     """
     Return a pretty-printed XML string for the xml data.
     """
-    rough_string = ETtree.tostring(data, 'utf-8')
-    reparsed = minidom.parseString(rough_string)
-    return reparsed.toprettyxml(indent="  ")
+    return writer.tostring(data)
 
 
 def is_valid_xml(data):
@@ -34,9 +46,73 @@ def is_valid_xml(data):
         return False
 
 
-def open_read_yaml(path):
-    with open(path) as df:
-        return yaml.load(df)
+def open_read_yaml(path, cache_dir=None):
+    return loader.load_yaml_file(path, cache_dir)
+
+
+def add_limit_arguments(p):
+    p.add_argument('--max-panels', type=int,
+                   help='Maximum estimated number of panels in the dashboard')
+    p.add_argument('--max-searches', type=int,
+                   help='Maximum estimated number of searches in the dashboard')
+    p.add_argument('--max-bytes', type=int,
+                   help='Maximum estimated size of the generated dashboard, in bytes')
+
+
+def limits(options):
+    return planner.Limits(max_panels=options.max_panels,
+                          max_searches=options.max_searches,
+                          max_size=options.max_bytes)
+
+
+def add_generate_arguments(p):
+    p.add_argument('--lazy', action='store_true',
+                   help='Expand templates lazily to reduce peak memory usage. It has no effect '
+                        'with --policy, --consolidate-searches, --search-budget, --threads > 1 '
+                        'or dashboards setting consolidateSearches, which need the whole dashboard')
+
+    p.add_argument('--memoize', action='store_true',
+                   help='Expand template subtrees only once per set of referenced arguments')
+
+    p.add_argument('-j', '--jobs', type=int, default=1,
+                   help='Number of processes used to expand templates. By default, 1')
+
+    p.add_argument('--cache-dir',
+                   type=str, default=os.path.expanduser('~/.cache/dashbuilder'),
+                   help='Directory where loaded yaml documents are cached. By default, ~/.cache/dashbuilder')
+
+    p.add_argument('--no-cache', action='store_true',
+                   help='Do not cache loaded yaml documents')
+
+    p.add_argument('--minify', action='store_true',
+                   help='Write canonical xml without indentation, with sorted attributes '
+                        'and normalized booleans')
+
+    p.add_argument('--stream', action='store_true',
+                   help='Write the xml while it is generated instead of building it in memory first')
+
+    p.add_argument('-t', '--threads', type=int, default=1,
+                   help='Number of threads used to build the rows of a dashboard. By default, 1')
+
+    p.add_argument('--policy',
+                   type=str,
+                   help='Path to a yaml file of policy rules applied to the searches')
+
+    p.add_argument('--consolidate-searches', action='store_true',
+                   help='Consolidate searches sharing a common prefix into base searches, '
+                        'even if the dashboard does not set consolidateSearches')
+
+    p.add_argument('--search-budget', type=int,
+                   help='Maximum number of searches started at once: rows are split into '
+                        'sections loaded on demand through a selector input')
+
+    p.add_argument('--stats', action='store_true',
+                   help='Print cache statistics to stderr once done')
+
+    p.add_argument('--interpreted', action='store_true',
+                   help='Render with the interpreted mappers instead of the compiled ones (for debugging)')
+
+    add_limit_arguments(p)
 
 
 def create_argument_parser():
@@ -46,11 +122,53 @@ def create_argument_parser():
     # Generate mode parser
     gen_parser = subparsers.add_parser('generate')
     gen_parser.add_argument('path', metavar='PATH_TO_YAML_DASHBOARD',
-                            type=str, nargs=1,
-                            help='Path to the dashboard yaml definition')
+                            type=str, nargs='+',
+                            help='Paths or glob patterns of the dashboard yaml definitions')
+
+    gen_parser.add_argument('-o', '--output-dir',
+                            type=str,
+                            help='Directory where the xml dashboards are written. '
+                                 'Required when generating more than one dashboard')
+
+    gen_parser.add_argument('--analyze', action='store_true',
+                            help='Print the token dependency analysis of the dashboards as json '
+                                 'instead of generating them')
+
+    gen_parser.add_argument('-w', '--workers', type=int, default=1,
+                            help='Number of processes used to generate dashboards in parallel. '
+                                 'When greater than 1, --jobs is ignored. By default, 1')
+
+    add_generate_arguments(gen_parser)
 
     gen_parser.set_defaults(mode='gen')
 
+    # Plan mode parser
+    plan_parser = subparsers.add_parser('plan')
+    plan_parser.add_argument('path', metavar='PATH_TO_YAML_DASHBOARD',
+                             type=str, nargs='+',
+                             help='Path to the dashboard yaml definitions')
+
+    add_limit_arguments(plan_parser)
+
+    plan_parser.set_defaults(mode='plan')
+
+    # Build mode parser
+    build_parser = subparsers.add_parser('build')
+    build_parser.add_argument('source', metavar='PATH_TO_YAML_DIRECTORY',
+                              type=str,
+                              help='Directory containing the dashboard yaml definitions')
+
+    build_parser.add_argument('-o', '--output-dir',
+                              type=str, required=True,
+                              help='Directory where the xml dashboards and the build manifest are written')
+
+    build_parser.add_argument('-f', '--force', action='store_true',
+                              help='Rebuild all dashboards, even if unchanged')
+
+    add_generate_arguments(build_parser)
+
+    build_parser.set_defaults(mode='build')
+
     # Publish mode parser
     pub_parser = subparsers.add_parser('publish')
     pub_parser.add_argument('-S', '--splunk-settings',
@@ -61,35 +179,340 @@ def create_argument_parser():
                             type=str,
                             help='Splunk App where the dashboard should be published')
 
+    pub_parser.add_argument('--session-cache',
+                            type=str, default=os.path.expanduser('~/.cache/dashbuilder/sessions.json'),
+                            help='File where Splunk session keys are kept between runs. '
+                                 'By default, ~/.cache/dashbuilder/sessions.json')
+
+    pub_parser.add_argument('--no-session-cache', action='store_true',
+                            help='Log in on every run instead of reusing a cached session key')
+
+    pub_parser.add_argument('--skip-unchanged', action='store_true',
+                            help='Do not publish dashboards identical to the ones last published, '
+                                 'according to the publish manifest or to the Splunk server')
+
+    pub_parser.add_argument('--manifest',
+                            type=str, default=os.path.expanduser('~/.cache/dashbuilder/publish-manifest.json'),
+                            help='File recording the dashboards published to each server and App. '
+                                 'By default, ~/.cache/dashbuilder/publish-manifest.json')
+
+    pub_parser.add_argument('-j', '--jobs', type=int, default=4,
+                            help='Number of dashboards published concurrently. By default, 4')
+
+    pub_parser.add_argument('--max-per-host', type=int, default=4,
+                            help='Maximum number of concurrent requests to the Splunk server. '
+                                 'By default, 4')
+
+    pub_parser.add_argument('--timeout', type=float, default=60,
+                            help='Timeout of requests to the Splunk server, in seconds. By default, 60')
+
+    pub_parser.add_argument('--retries', type=int, default=3,
+                            help='Number of times failed requests are retried. By default, 3')
+
+    pub_parser.add_argument('--rate', type=float,
+                            help='Maximum number of requests per second to the Splunk server')
+
+    pub_parser.add_argument('--stats', action='store_true',
+                            help='Print request, retry and latency counters to stderr once done')
+
     pub_parser.add_argument('path',
                             metavar='PATH_TO_XML_DASHBOARD',
-                            type=str, nargs=1,
-                            help='Path to the dashboard xml definition')
+                            type=str, nargs='+',
+                            help='Paths, glob patterns or directories of the dashboard xml definitions')
 
     pub_parser.set_defaults(mode='pub')
     return p
 
 
-def generate_mode(options):
-    data = open_read_yaml(options.path[0])
+def load_dashboard(path, options):
+    cache_dir = None if options.no_cache else options.cache_dir
+    data = open_read_yaml(path, cache_dir)
+    planner.check_limits(data, limits(options))
+
+    context = parser.Context(lazy=options.lazy,
+                             memoize=options.memoize,
+                             jobs=options.jobs)
+
+    data = parser.parse(data, context=context)
+
+    if options.policy is not None:
+        data, changes = policy.apply_policies(data, policy.load_rules(options.policy))
+        for change in changes:
+            print >> sys.stderr, "{}: {}".format(path, change)
+
+    data, report = optimizer.consolidate_searches(data, force=options.consolidate_searches)
+    if report.consolidated:
+        print >> sys.stderr, "{}: {} search(es) consolidated into {} base search(es), {} removed".format(
+            path, report.consolidated, report.bases, report.removed())
+
+    if options.search_budget is not None:
+        data, groups = layout.limit_concurrent_searches(data, options.search_budget)
+        if groups > 1:
+            print >> sys.stderr, "{}: rows split into {} sections of at most {} search(es)".format(
+                path, groups, options.search_budget)
+
+    return data
 
-    print pretty_xml(
+
+def registry(options):
+    return factory.INTERPRETED if options.interpreted else factory.REGISTRY
+
+
+def generate(path, options):
+    to_xml = writer.minify if options.minify else pretty_xml
+    return to_xml(
         factory.create(
-            parser.parse(data)))
+            load_dashboard(path, options),
+            threads=options.threads,
+            registry=registry(options)))
+
+
+def write_dashboard(path, options, fp):
+    if options.stream:
+        w = writer.MinifiedXmlWriter(fp) if options.minify else writer.XmlWriter(fp)
+        factory.stream(load_dashboard(path, options), w, registry=registry(options))
+    else:
+        fp.write(generate(path, options))
+
 
+def expand_paths(patterns):
+    """
+    Expands glob patterns, keeping patterns matching nothing as is. Files
+    given more than once are only kept the first time.
+    """
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            key = os.path.normcase(os.path.abspath(path))
+            if key not in seen:
+                seen.add(key)
+                paths.append(path)
+    return paths
+
+
+def fragment_counters():
+    stats = factory.HTML_FRAGMENTS.stats()
+    return collections.Counter(hits=stats["hits"], misses=stats["misses"])
+
+
+def generate_file(job):
+    """
+    Generates one dashboard into its output file, returning the error that
+    occurred if any, and the html fragment cache counters of this dashboard
+    (worker processes each have their own cache).
+    """
+    path, output, options = job
+    before = fragment_counters()
+    try:
+        with open(output, 'wb') as fp:
+            write_dashboard(path, options, fp)
+        error = None
+    except Exception as e:
+        if os.path.exists(output):
+            os.remove(output)
+        error = "{}: {}".format(type(e).__name__, e)
+    return path, error, fragment_counters() - before
+
+
+def generate_many(paths, options, stats=None):
+    """
+    Generates dashboards into the output directory, yielding the error of
+    each one if any. The html fragment cache counters of every dashboard
+    are added to stats when given.
+    """
+    outputs = [os.path.join(options.output_dir,
+                            os.path.splitext(os.path.basename(path))[0] + ".xml")
+               for path in paths]
+
+    # Dashboards with the same name would overwrite each other
+    counts = collections.Counter(outputs)
+    for path, output in zip(paths, outputs):
+        if counts[output] > 1:
+            yield path, "ValueError: output {} is shared with {} other dashboard(s)".format(
+                output, counts[output] - 1)
+
+    jobs = [(path, output, options)
+            for path, output in zip(paths, outputs)
+            if counts[output] == 1]
+
+    if options.workers <= 1:
+        for path, error, counters in itertools.imap(generate_file, jobs):
+            if stats is not None:
+                stats.update(counters)
+            yield path, error
+        return
+
+    # Worker processes cannot spawn their own pool
+    worker_options = copy.copy(options)
+    worker_options.jobs = 1
+    jobs = [(path, output, worker_options) for path, output, _ in jobs]
+
+    pool = multiprocessing.Pool(options.workers)
+    try:
+        for path, error, counters in pool.imap(generate_file, jobs):
+            if stats is not None:
+                stats.update(counters)
+            yield path, error
+    finally:
+        pool.close()
+        pool.join()
+
+
+def print_stats(options, fragments=None):
+    if options.stats:
+        if fragments is None:
+            fragments = factory.HTML_FRAGMENTS.stats()
+        print >> sys.stderr, dump({"html_fragments": fragments})
+
+
+def analyze_mode(paths, options):
+    report = {}
+    status = 0
+    for path in paths:
+        report[path] = analyzer.analyze(load_dashboard(path, options))
+        if report[path]["unresolved"]:
+            status = 1
+
+    print dump(report)
+    return status
+
+
+def generate_mode(options):
+    paths = expand_paths(options.path)
+
+    if options.analyze:
+        return analyze_mode(paths, options)
+
+    if options.output_dir is None:
+        if len(paths) != 1:
+            raise ValueError('--output-dir is required to generate more than one dashboard')
+        write_dashboard(paths[0], options, sys.stdout)
+        print
+        print_stats(options)
+        return 0
+
+    if not os.path.isdir(options.output_dir):
+        os.makedirs(options.output_dir)
+
+    stats = collections.Counter()
+    errors = [(path, error)
+              for path, error in generate_many(paths, options, stats)
+              if error is not None]
+
+    print "{} dashboard(s) generated, {} failed".format(
+        len(paths) - len(errors), len(errors))
+    for path, error in errors:
+        print >> sys.stderr, "{}: {}".format(path, error)
+
+    # The counters of the parent process miss those of worker processes
+    print_stats(options, {"hits": stats["hits"], "misses": stats["misses"]})
+    return 1 if errors else 0
+
+
+def build_settings(options):
+    """
+    Returns the options changing the generated xml, including the content
+    of the policy file.
+    """
+    return {"minify": options.minify,
+            "policy": None if options.policy is None else build.file_hash(options.policy),
+            "search_budget": options.search_budget,
+            "consolidate_searches": options.consolidate_searches}
+
+
+def build_mode(options):
+    report = build.build_directory(
+        options.source,
+        options.output_dir,
+        lambda path: generate(path, options),
+        force=options.force,
+        settings=build_settings(options))
+
+    print "{} dashboard(s) built, {} unchanged, {} removed".format(
+        len(report["built"]), len(report["skipped"]), len(report["removed"]))
     return 0
 
 
-def publish_mode(options):
-    path = options.path[0]
-    with open(path) as fp:
-        data = fp.read()
+def plan_mode(options):
+    report = {}
+    status = 0
+    for path in options.path:
+        estimate = planner.estimate(open_read_yaml(path))
+        violations = limits(options).violations(estimate)
+        report[path] = dict(estimate.to_dict(), violations=violations)
+        if violations:
+            status = 1
+
+    print dump(report)
+    return status
+
 
-    if not is_valid_xml(data):
-        raise ValueError('not valid xml input')
+def expand_xml_paths(patterns):
+    paths = []
+    for path in expand_paths(patterns):
+        if os.path.isdir(path):
+            paths.extend(sorted(glob.glob(os.path.join(path, '*.xml'))))
+        else:
+            paths.append(path)
+    return paths
 
-    print "dashboard is valid xml"
-    print "warning, the xml file is not validated against splunk dashboard schema"
+
+def publish_file(client, app, path, manifest=None, skip_unchanged=False):
+    """
+    Publishes one xml dashboard, named after its file. Returns the path,
+    the action taken and the error that occurred if any.
+    """
+    dashboard = dashboard_name(path)
+    try:
+        with open(path) as fp:
+            data = fp.read()
+
+        if not is_valid_xml(data):
+            raise ValueError('not valid xml input')
+
+        return path, publisher.publish(client, app, dashboard, data,
+                                       manifest=manifest,
+                                       skip_unchanged=skip_unchanged), None
+    except Exception as e:
+        return path, "failed", "{}: {}".format(type(e).__name__, e)
+
+
+def dashboard_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def publish_many(client, app, paths, jobs, manifest=None, skip_unchanged=False):
+    # Dashboards with the same name would be published to the same view
+    counts = collections.Counter(dashboard_name(path) for path in paths)
+    for path in paths:
+        if counts[dashboard_name(path)] > 1:
+            yield path, "failed", "ValueError: dashboard '{}' is shared with {} other file(s)".format(
+                dashboard_name(path), counts[dashboard_name(path)] - 1)
+    paths = [path for path in paths if counts[dashboard_name(path)] == 1]
+
+    publish = functools.partial(publish_file, client, app,
+                                manifest=manifest,
+                                skip_unchanged=skip_unchanged)
+    if jobs <= 1:
+        for result in itertools.imap(publish, paths):
+            yield result
+        return
+
+    # Threads share the client, its connections and its session key
+    pool = ThreadPool(jobs)
+    try:
+        for result in pool.imap_unordered(publish, paths):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+def publish_mode(options):
+    paths = expand_xml_paths(options.path)
+
+    print "warning, the xml files are not validated against splunk dashboard schema"
 
     settings = open_read_yaml(options.splunk_settings)['settings']
     user = settings["username"]
@@ -97,41 +520,89 @@ def publish_mode(options):
     api = settings["api"]
     port = settings.get("port", 8089)
 
+    sessions = None
+    if not options.no_session_cache:
+        sessions = splunk.SessionCache(options.session_cache)
+
+    transport = splunk.Transport(timeout=options.timeout,
+                                 max_per_host=options.max_per_host)
+    scheduler = splunk.Scheduler(transport,
+                                 policy=splunk.RetryPolicy(retries=options.retries),
+                                 rate=options.rate,
+                                 burst=options.max_per_host)
+
     client = splunk.Client(splunk.ServerInfo(api, port),
-                           splunk.AuthenticationInfo(user, password))
-
-    dashboard = os.path.splitext(
-        os.path.basename(path))[0]
-
-    print "checking dashboard status"
-    if client.dashboards().exists(options.app, dashboard):
-        print "will update dashboard '{}' in App '{}'".format(dashboard, options.app)
-        client.dashboards().update(
-            options.app,
-            dashboard,
-            data)
-    else:
-        print "will create a new dashboard '{}' in App '{}'".format(dashboard, options.app)
-        client.dashboards().create(
-            options.app,
-            dashboard,
-            data)
+                           splunk.AuthenticationInfo(user, password),
+                           transport=transport,
+                           sessions=sessions,
+                           scheduler=scheduler)
 
-    print "dashboard published successfully"
-    return 0
+    manifest = publisher.PublishManifest(options.manifest)
+
+    report = {}
+    try:
+        # A single listing of the app saves an existence check per dashboard.
+        # Without it, dashboards are updated first and created if missing
+        try:
+            client.dashboards().views(options.app)
+        except Exception as e:
+            print >> sys.stderr, "could not list the dashboards of App '{}', checking them one by one: {}: {}".format(
+                options.app, type(e).__name__, e)
+
+        for i, (path, action, error) in enumerate(
+                publish_many(client, options.app, paths, options.jobs,
+                             manifest=manifest,
+                             skip_unchanged=options.skip_unchanged)):
+            report[path] = {"action": action, "error": error}
+            print >> sys.stderr, "[{}/{}] {}: {}".format(i + 1, len(paths), path, action)
+    finally:
+        client.close()
+        manifest.save()
+        if options.stats:
+            print >> sys.stderr, dump(client.stats())
+
+    failed = [path for path in paths if report[path]["error"] is not None]
+    unchanged = [path for path in paths if report[path]["action"] == "unchanged"]
+    print dump(report)
+    print "{} dashboard(s) published to App '{}', {} unchanged, {} failed".format(
+        len(paths) - len(unchanged) - len(failed), options.app, len(unchanged), len(failed))
+    return 1 if failed else 0
 
 
 def modes():
     return {
         'gen': generate_mode,
+        'plan': plan_mode,
+        'build': build_mode,
         'pub': publish_mode
     }
 
 
+def lazy_conflicts(options):
+    """
+    Returns the options which expand the whole dashboard at once, so that
+    --lazy has no effect.
+    """
+    conflicts = []
+    if options.policy is not None:
+        conflicts.append("--policy")
+    if options.consolidate_searches:
+        conflicts.append("--consolidate-searches")
+    if options.search_budget is not None:
+        conflicts.append("--search-budget")
+    if options.threads > 1:
+        conflicts.append("--threads")
+    return conflicts
+
+
 def main():
     p = create_argument_parser()
     options = p.parse_args()
 
+    if getattr(options, "lazy", False) and lazy_conflicts(options):
+        print >> sys.stderr, "warning: --lazy has no effect with {}".format(
+            ", ".join(lazy_conflicts(options)))
+
     handler = modes()[options.mode]
     sys.exit(handler(options))
 
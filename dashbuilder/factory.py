@@ -1,4 +1,7 @@
+import collections
+import threading
 import xml.etree.ElementTree as ETtree
+from multiprocessing.pool import ThreadPool
 from mapper import Mapper
 
 
@@ -33,7 +36,8 @@ def mappings():
         Tags.Event: EventFactory,
         Tags.Map: MapFactory,
         Tags.Single: SingleFactory,
-        Tags.Checkbox: CheckboxFactory
+        Tags.Checkbox: CheckboxFactory,
+        Tags.Radio: RadioFactory
     }
 
 
@@ -57,6 +61,102 @@ def strip_xml(elem):
             elem.tail = elem.tail.strip()
 
 
+def copy_element(elem):
+    copy = ETtree.Element(elem.tag, dict(elem.attrib))
+    copy.text = elem.text
+    copy.tail = elem.tail
+    for child in elem:
+        copy.append(copy_element(child))
+    return copy
+
+
+class FragmentCache(object):
+    """
+    Bounded LRU cache of parsed XML fragments, keyed by content. Cached
+    elements are never handed out: callers get their own copy, which
+    they are free to modify.
+    """
+    def __init__(self, parse, maxsize=256):
+        self.parse = parse
+        self.maxsize = maxsize
+        self.fragments = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, content):
+        with self.lock:
+            fragment = self.fragments.pop(content, None)
+            if fragment is not None:
+                self.hits += 1
+                self.fragments[content] = fragment
+                return copy_element(fragment)
+            self.misses += 1
+
+        fragment = self.parse(content)
+        with self.lock:
+            self.fragments[content] = fragment
+            while len(self.fragments) > self.maxsize:
+                self.fragments.popitem(last=False)
+        return copy_element(fragment)
+
+    def stats(self):
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.fragments)}
+
+
+class Registry(object):
+    """
+    Builds factories on demand. When shared, each factory is built once for
+    a given set of arguments, frozen, and reused by every parent factory.
+    Unless compile is False, frozen factories render through compiled
+    mappers.
+    """
+    def __init__(self, shared=True, compile=True):
+        self.shared = shared
+        self.compile = compile
+        self.factories = {}
+
+    def build(self, cls, *args):
+        # Factories get their children while being built, which must come
+        # from the registry building them
+        outer = getattr(BUILDING, "registry", None)
+        BUILDING.registry = self
+        try:
+            return cls(*args)
+        finally:
+            BUILDING.registry = outer
+
+    def get(self, cls, *args):
+        if not self.shared:
+            return self.build(cls, *args)
+
+        key = (cls,) + args
+        instance = self.factories.get(key)
+        if instance is None:
+            instance = self.build(cls, *args)
+            instance.mapper.freeze(compile=self.compile)
+            self.factories[key] = instance
+        return instance
+
+
+BUILDING = threading.local()
+REGISTRY = Registry()
+INTERPRETED = Registry(compile=False)
+
+
+def current_registry():
+    """
+    Returns the registry building a factory, or the default one.
+    """
+    return getattr(BUILDING, "registry", None) or REGISTRY
+
+
+def get(cls, *args):
+    return current_registry().get(cls, *args)
+
+
 class Filterable(object):
     def __call__(self, factory):
         (factory.mapper
@@ -96,20 +196,27 @@ class BaseFactory(object):
         for flavour in args:
             flavour(self)
     
-    def __call__(self, data):
+    def __call__(self, data, executor=None):
         if self.__doc__ is None:
             raise RuntimeError("Factories not implementing __call__ must provide a docstring")
 
         obj = ETtree.Element(self.__doc__)
-        self.mapper.map(data).into(obj)
+        self.mapper.render(data, obj, executor)
         return obj
 
+    def stream(self, data, writer):
+        if self.__doc__ is None:
+            raise RuntimeError("Factories not implementing stream must provide a docstring")
+
+        self.mapper.stream(self.__doc__, data, writer)
+
 
 class Either(BaseFactory):
     def __init__(self, *args):
         super(Either, self).__init__()
 
         self.mapping = {}
+        self.registry = current_registry()
 
         m = mappings()
         for t in args:
@@ -117,7 +224,7 @@ class Either(BaseFactory):
                 raise KeyError("No factory defined for type '{}'".format(t))
             self.mapping[t] = m[t]
 
-    def __call__(self, data, t=None):
+    def __call__(self, data, t=None, executor=None):
         # If t is None, the data type is infered from the only key of the dict
         # Data must be of this form: { "the_object_type" : X }
         # Where 'X' is of any type.
@@ -133,9 +240,20 @@ class Either(BaseFactory):
                 (object must be of type: {})""".format(
                     t, ", ".join(self.mapping)))
 
-        t_factory = self.mapping[t]()
+        t_factory = self.registry.get(self.mapping[t])
+        if executor is not None:
+            return t_factory(data, executor=executor)
         return t_factory(data)
 
+    def stream(self, data, writer):
+        t = infer_data_type(data)
+        if t not in self.mapping:
+            raise KeyError("""'{}' is not a valid choice
+                (object must be of type: {})""".format(
+                    t, ", ".join(self.mapping)))
+
+        self.registry.get(self.mapping[t]).stream(data[t], writer)
+
 
 class Wrap(BaseFactory):
     def __init__(self, factory, text):
@@ -148,6 +266,9 @@ class Wrap(BaseFactory):
         obj.append(self.factory(data))
         return obj
 
+    def stream(self, data, writer):
+        writer.element(self(data))
+
 
 class ListFormatter(object):
     def __call__(self, data):
@@ -161,7 +282,7 @@ class KVFactory(BaseFactory):
         self.k = k
 
         (self.mapper
-             .add_attribute(k)
+             .add_attribute("name", dest=k)
              .add_text("value"))
 
     def __call__(self, kv):
@@ -169,14 +290,19 @@ class KVFactory(BaseFactory):
         data = {"name": key, "value": value}
 
         kv = ETtree.Element(self.t)
-        self.mapper.map(data).into(kv)
+        self.mapper.render(data, kv)
         return kv
 
+    def stream(self, kv, writer):
+        key, value = kv
+        self.mapper.stream(self.t, {"name": key, "value": value}, writer)
+
 
 class SearchFactory(BaseFactory):
     """search"""
     def __init__(self):
         super(SearchFactory, self).__init__()
+        self.add_trait(Filterable())
         (self.mapper
          .add_attribute("app", arity='?')
          .add_attribute("base", arity='?')
@@ -188,7 +314,9 @@ class SearchFactory(BaseFactory):
          .add_text_member("query", arity='?')
          .add_text_member("refresh", arity='?')
          .add_text_member("refreshType", arity='?')
-         .add_text_member("sampleRatio", arity='?'))
+         .add_text_member("sampleRatio", arity='?')
+         # Opt-out of the policy stage, which only removes it when enabled
+         .add_ignored("policy"))
 
 
 class InputFactory(BaseFactory):
@@ -202,9 +330,12 @@ class InputFactory(BaseFactory):
 
     def __call__(self, data):
         obj = ETtree.Element("input")
-        self.mapper.map(data).into(obj)
+        self.mapper.render(data, obj)
         return obj
 
+    def stream(self, data, writer):
+        self.mapper.stream("input", data, writer)
+
 
 class TimeFactory(InputFactory):
     """time"""
@@ -227,7 +358,52 @@ class CheckboxFactory(InputFactory):
          .add_member("valueSuffic", arity='?')
          .add_member("choices",
                      arity='*',
-                     factory=KVFactory("choice", "value")))
+                     factory=get(KVFactory, "choice", "value")))
+
+
+class RadioFactory(InputFactory):
+    """radio"""
+    def __init__(self):
+        super(RadioFactory, self).__init__()
+        (self.mapper
+         .add_member("choices",
+                     arity='*',
+                     factory=get(KVFactory, "choice", "value"))
+         .add_text_member("default", arity='?')
+         .add_member("change", arity='?', factory=get(ChangeFactory)))
+
+
+class UnsetFactory(BaseFactory):
+    """unset"""
+    def __init__(self):
+        super(UnsetFactory, self).__init__()
+        (self.mapper
+         .add_attribute("token"))
+
+    def __call__(self, token):
+        return super(UnsetFactory, self).__call__({"token": token})
+
+    def stream(self, token, writer):
+        super(UnsetFactory, self).stream({"token": token}, writer)
+
+
+class ConditionFactory(BaseFactory):
+    """condition"""
+    def __init__(self):
+        super(ConditionFactory, self).__init__()
+        (self.mapper
+         .add_attribute("value", arity='?')
+         .add_attribute("label", arity='?')
+         .add_member("set", arity='*', factory=get(KVFactory, "set", "token"))
+         .add_member("unset", arity='*', factory=get(UnsetFactory)))
+
+
+class ChangeFactory(BaseFactory):
+    """change"""
+    def __init__(self):
+        super(ChangeFactory, self).__init__()
+        (self.mapper
+         .add_member("conditions", arity='*', factory=get(ConditionFactory)))
 
 
 class VisualizationFactory(BaseFactory):
@@ -241,10 +417,10 @@ class SearchBasedVisualizationFactory(VisualizationFactory):
         super(SearchBasedVisualizationFactory, self).__init__()
         (self.mapper
          .add_member("options",
-                     factory=KVFactory(Tags.Option),
+                     factory=get(KVFactory, Tags.Option),
                      arity='*')
          .add_member(Tags.Search,
-                     factory=SearchFactory(),
+                     factory=get(SearchFactory),
                      arity='?'))
 
 
@@ -283,18 +459,28 @@ class HtmlFactory(VisualizationFactory):
     def __init__(self):
         super(VisualizationFactory, self).__init__()
         (self.mapper
+         .add_ignored("html")
          .add_attribute("encoded", arity='?')
          .add_attribute("src", arity='?')
          .add_attribute("tokens", arity='?'))
 
     def __call__(self, data):
-        raw = ("<html>" + data["html"] + "</html>")
-        html = ETtree.XML(raw)
-        strip_xml(html)
-
-        self.mapper.map(data).into(html, safe=True)
+        html = HTML_FRAGMENTS.get(data["html"])
+        self.mapper.render(data, html)
         return html
 
+    def stream(self, data, writer):
+        writer.element(self(data))
+
+
+def parse_html(content):
+    html = ETtree.XML("<html>" + content + "</html>")
+    strip_xml(html)
+    return html
+
+
+HTML_FRAGMENTS = FragmentCache(parse_html)
+
 
 class FieldsetFactory(BaseFactory):
     """fieldset"""
@@ -305,8 +491,10 @@ class FieldsetFactory(BaseFactory):
          .add_attribute("submitButton", arity='?')
          .add_member("items",
                      arity='*',
-                     factory=Either(Tags.Time,
-                                    Tags.Checkbox)))
+                     factory=get(Either,
+                                 Tags.Time,
+                                 Tags.Checkbox,
+                                 Tags.Radio)))
 
 
 class RowFactory(BaseFactory):
@@ -317,7 +505,7 @@ class RowFactory(BaseFactory):
         (self.mapper
          .add_attribute("grouping", arity='?')
          .add_member("panels",
-                     factory=PanelFactory(),
+                     factory=get(PanelFactory),
                      arity='*'))
 
 
@@ -340,9 +528,10 @@ class BaseDashboardFactory(BaseFactory):
          .add_attribute("stylesheet", arity='?')
          .add_text_member("label", arity='?')
          .add_text_member("description", arity='?')
-         .add_member("search", factory=SearchFactory(), arity='?')
-         .add_member("rows", factory=RowFactory(), arity='*')
-         .add_member("fieldset", factory=FieldsetFactory(), arity='?'))
+         .add_member("search", factory=get(SearchFactory), arity='?')
+         .add_member("searches", factory=get(SearchFactory), arity='*')
+         .add_member("rows", factory=get(RowFactory), arity='*', concurrent=True)
+         .add_member("fieldset", factory=get(FieldsetFactory), arity='?'))
 
 
 class DashboardFactory(BaseDashboardFactory):
@@ -367,19 +556,40 @@ class PanelFactory(BaseFactory):
          .add_attribute("rejects", arity='?')
          .add_text_member("title", arity='?')
          .add_text_member("description", arity='?')
-         .add_member("search", factory=SearchFactory(), arity='?')
+         .add_member("search", factory=get(SearchFactory), arity='?')
          .add_member("items",
-                     factory=Either(Tags.Table,
-                                    Tags.Html,
-                                    Tags.Chart,
-                                    Tags.Event,
-                                    Tags.Map,
-                                    Tags.Single),
+                     factory=get(Either,
+                                 Tags.Table,
+                                 Tags.Html,
+                                 Tags.Chart,
+                                 Tags.Event,
+                                 Tags.Map,
+                                 Tags.Single),
                      arity='+'))
 
 
-def create(data):
+def stream(data, writer, registry=REGISTRY):
+    """
+    Writes a Splunk dashboard from json formatted data to a streaming
+    writer, without building the whole element tree.
+    """
+    writer.start_document()
+    registry.get(Either, Tags.Dashboard, Tags.Form).stream(data, writer)
+    writer.end_document()
+
+
+def create(data, threads=1, registry=REGISTRY):
     """
-    Creates a Splunk dashboard from json formatted data.
+    Creates a Splunk dashboard from json formatted data. With more than one
+    thread, rows are built concurrently and assembled in order.
     """
-    return Either(Tags.Dashboard, Tags.Form)(data)
+    dashboard_factory = registry.get(Either, Tags.Dashboard, Tags.Form)
+    if threads <= 1:
+        return dashboard_factory(data)
+
+    pool = ThreadPool(threads)
+    try:
+        return dashboard_factory(data, executor=pool)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,187 @@
+import optimizer
+
+
+class Tags(object):
+    Dashboard = "dashboard"
+    Form = "form"
+    Fieldset = "fieldset"
+    Items = "items"
+    Rows = "rows"
+    Panels = "panels"
+    Search = "search"
+    Searches = "searches"
+    Base = "base"
+    Id = "id"
+    Depends = "depends"
+    Radio = "radio"
+
+
+GROUP_TOKEN = "lazy_group"
+GROUP_LABEL = "Section {}"
+
+
+def row_searches(row):
+    """
+    Returns the searches of a row, as found in its panels and visualizations.
+    """
+    searches = []
+    for panel in row.get(Tags.Panels, []):
+        if isinstance(panel.get(Tags.Search), dict):
+            searches.append(panel[Tags.Search])
+        for item in panel.get(Tags.Items, []):
+            for visualization in item.itervalues():
+                if isinstance(visualization, dict) and isinstance(visualization.get(Tags.Search), dict):
+                    searches.append(visualization[Tags.Search])
+    return searches
+
+
+def cost(row):
+    # Post-process searches do not start jobs of their own
+    return len([search for search in row_searches(row) if Tags.Base not in search])
+
+
+def row_bases(row):
+    return set(search[Tags.Base] for search in row_searches(row) if Tags.Base in search)
+
+
+def global_searches(dashboard):
+    """
+    Returns the searches of the dashboard itself that start jobs.
+    """
+    searches = [search for search in dashboard.get(Tags.Searches, [])
+                if isinstance(search, dict) and Tags.Base not in search]
+    search = dashboard.get(Tags.Search)
+    if isinstance(search, dict) and Tags.Base not in search:
+        searches.append(search)
+    return searches
+
+
+def group_rows(rows, budget, bases=frozenset()):
+    """
+    Packs consecutive rows into groups running at most budget searches. A
+    row costs its own searches plus the base searches (ids in bases) it
+    post-processes that the group does not run yet. A row exceeding the
+    budget on its own gets a group of its own.
+    """
+    groups = []
+    current, total, running = [], 0, set()
+    for row in rows:
+        used = row_bases(row) & bases
+        n = cost(row) + len(used - running)
+        if current and total + n > budget:
+            groups.append(current)
+            current, total, running = [], 0, set()
+            n = cost(row) + len(used)
+        current.append(row)
+        total += n
+        running |= used
+    if current:
+        groups.append(current)
+    return groups
+
+
+def add_depends(data, token):
+    depends = data.get(Tags.Depends)
+    data[Tags.Depends] = token if not depends else depends + "," + token
+
+
+def selector(count):
+    tokens = ["{}_{}".format(GROUP_TOKEN, i) for i in xrange(1, count + 1)]
+    conditions = []
+    for i, token in enumerate(tokens):
+        conditions.append({
+            "value": str(i + 1),
+            "set": {token: "true"},
+            "unset": [other for other in tokens if other != token]})
+
+    return {Tags.Radio: {
+        "token": GROUP_TOKEN,
+        "label": "Section",
+        "choices": [(str(i), GROUP_LABEL.format(i)) for i in xrange(1, count + 1)],
+        "default": "1",
+        "change": {"conditions": conditions}}}
+
+
+def unique_id(base_id, used_ids):
+    while base_id in used_ids:
+        base_id += "_"
+    used_ids.add(base_id)
+    return base_id
+
+
+def gate_base_searches(dashboard, groups, tokens, bases):
+    """
+    Makes base searches depend on the token of the group using them. Groups
+    after the first one using a base search get a copy of it, since only
+    one group is shown at a time and depends cannot express 'any of'.
+    """
+    used_ids = optimizer.search_ids(dashboard)
+    copies = []
+    for base_id, base in sorted(bases.iteritems()):
+        original = dict(base)
+        first = True
+        for rows, token in zip(groups, tokens):
+            if not any(base_id in row_bases(row) for row in rows):
+                continue
+
+            if first:
+                add_depends(base, token)
+                first = False
+                continue
+
+            copy = dict(original)
+            copy[Tags.Id] = unique_id(base_id, used_ids)
+            add_depends(copy, token)
+            copies.append(copy)
+            for row in rows:
+                for search in row_searches(row):
+                    if search.get(Tags.Base) == base_id:
+                        search[Tags.Base] = copy[Tags.Id]
+
+    if copies:
+        dashboard[Tags.Searches] = list(dashboard.get(Tags.Searches, [])) + copies
+
+
+def limit_concurrent_searches(data, budget):
+    """
+    Splits the rows of a parsed dashboard into groups running at most budget
+    searches each. Rows, their searches and the base searches they use
+    depend on a token per group, set by a radio input added to the
+    fieldset, so that only the selected group is shown and searched.
+    Searches of the dashboard not used by any row run in every group and
+    count against the budget. Dashboards are turned into forms, since they
+    need an input. Returns the new data and the number of groups.
+    """
+    t, dashboard = data.items()[0]
+    dashboard = optimizer.copy_tree(dashboard)
+    rows = dashboard.get(Tags.Rows, [])
+
+    used = set()
+    for row in rows:
+        used |= row_bases(row)
+
+    bases = {}
+    always = 0
+    for search in global_searches(dashboard):
+        if search.get(Tags.Id) in used:
+            bases[search[Tags.Id]] = search
+        else:
+            always += 1
+
+    groups = group_rows(rows, max(budget - always, 0), frozenset(bases))
+    if len(groups) < 2:
+        return {t: dashboard}, len(groups)
+
+    tokens = ["${}_{}$".format(GROUP_TOKEN, i + 1) for i in xrange(len(groups))]
+    for rows, token in zip(groups, tokens):
+        for row in rows:
+            add_depends(row, token)
+            for search in row_searches(row):
+                add_depends(search, token)
+
+    gate_base_searches(dashboard, groups, tokens, bases)
+
+    fieldset = dashboard.setdefault(Tags.Fieldset, {})
+    fieldset[Tags.Items] = list(fieldset.get(Tags.Items, [])) + [selector(len(groups))]
+
+    return {Tags.Form: dashboard}, len(groups)
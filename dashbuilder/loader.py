@@ -0,0 +1,78 @@
+import hashlib
+import marshal
+import os
+import tempfile
+import yaml
+
+try:
+    from yaml import CLoader as Loader
+except ImportError:
+    from yaml import Loader
+
+# Bump when the format of cached documents changes
+CACHE_FORMAT = 2
+
+
+def loader_version():
+    return "{}-{}-{}".format(yaml.__version__, Loader.__name__, CACHE_FORMAT)
+
+
+def load_yaml(content):
+    return yaml.load(content, Loader=Loader)
+
+
+def cache_path(cache_dir, content):
+    digest = hashlib.sha1(loader_version())
+    digest.update(content)
+    return os.path.join(cache_dir, digest.hexdigest() + ".marshal")
+
+
+def read_cache(path):
+    # Documents are plain data: marshal is compact and, unlike pickle,
+    # never runs code from the cache directory. Corrupt entries are
+    # parsed again.
+    try:
+        with open(path, 'rb') as fp:
+            return True, marshal.load(fp)
+    except (IOError, EOFError, ValueError, TypeError):
+        return False, None
+
+
+def write_cache(path, data):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    # Write to a temporary file first, so that concurrent runs never
+    # read a partially written document
+    data = marshal.dumps(data)
+    fd, tmp = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'wb') as fp:
+        fp.write(data)
+    os.rename(tmp, path)
+
+
+def load_yaml_file(path, cache_dir=None):
+    """
+    Loads a yaml file. If cache_dir is set, the loaded document is cached
+    there, keyed by the file content and the loader version.
+    """
+    with open(path) as fp:
+        content = fp.read()
+
+    if cache_dir is None:
+        return load_yaml(content)
+
+    cached = cache_path(cache_dir, content)
+    found, data = read_cache(cached)
+    if found:
+        return data
+
+    data = load_yaml(content)
+    try:
+        write_cache(cached, data)
+    except (IOError, OSError, ValueError):
+        # ValueError: the document holds values marshal cannot store,
+        # such as dates
+        pass
+    return data
@@ -1,3 +1,6 @@
+import itertools
+import types
+import warnings
 import xml.etree.ElementTree as ETtree
 
 
@@ -14,12 +17,13 @@ def identity(value):
 
 
 class GenericMapper(object):
-    def __init__(self, source, dest, arity, default, factory):
+    def __init__(self, source, dest, arity, default, factory, concurrent=False):
         self.source = source
         self.dest = dest
         self.arity = arity
         self.default = default
         self.factory = factory
+        self.concurrent = concurrent
 
     def assign(self, root, value):
         pass
@@ -30,24 +34,27 @@ class GenericMapper(object):
     def iterable_expected(self):
         return self.arity == '*' or self.arity == '+'
 
-    def __call__(self, data, root):
-        if self.source in data:
-            if self.iterable_expected():
-                items = data[self.source]
-                if isinstance(items, list):
-                    for item in items:
-                        self.assign(root, self.factory(item))
-                elif isinstance(items, dict):
-                    for k, v in items.iteritems():
-                        self.assign(root, self.factory((k, v)))
-                else:
-                    raise ValueError("""Expected iterable data (list or dict)
-                        got '{}' instead (data = {})""".format(
-                        type(data), data))
-            else:
-                self.assign(root, self.factory(data[self.source]))
-            return
-
+    def items(self, value):
+        if isinstance(value, (list, types.GeneratorType)):
+            return value
+        if isinstance(value, dict):
+            return value.iteritems()
+        raise ValueError("""Expected iterable data (list or dict)
+            got '{}' instead (data = {})""".format(
+            type(value), value))
+
+    def emit(self, root, value, executor=None):
+        if self.iterable_expected():
+            build = itertools.imap
+            if executor is not None and self.concurrent:
+                build = executor.imap
+
+            for child in build(self.factory, self.items(value)):
+                self.assign(root, child)
+        else:
+            self.assign(root, self.factory(value))
+
+    def missing(self, root):
         if not is_undefined(self.default):
             self.assign(root, self.default)
             return
@@ -56,15 +63,53 @@ class GenericMapper(object):
             raise ValueError("Non-optional key '{}' not found in data".format(
                 self.source))
 
+    def compile(self):
+        """
+        Returns the functions called when the source key is present in the
+        data and when it is missing (None if there is nothing to do).
+        """
+        if self.iterable_expected():
+            emit = self.emit
+        elif self.factory is identity:
+            emit = self.assign
+        else:
+            assign, factory = self.assign, self.factory
+
+            def emit(root, value):
+                assign(root, factory(value))
+
+        if is_undefined(self.default) and self.is_optional():
+            return emit, None
+        return emit, self.missing
+
+    def __call__(self, data, root, executor=None):
+        if self.source in data:
+            self.emit(root, data[self.source], executor)
+        else:
+            self.missing(root)
+
+    def stream(self, data, writer):
+        scratch = ETtree.Element("scratch")
+        self(data, scratch)
+        writer.text(scratch.text)
+        for child in scratch:
+            writer.element(child)
+
 
 class StaticAttributeMapper(object):
     def __init__(self, dest, value):
         self.dest = dest
         self.value = value
 
-    def __call__(self, _, root):
+    def missing(self, root):
         root.attrib[self.dest] = str(self.value)
 
+    def compile(self):
+        return None, self.missing
+
+    def __call__(self, _, root, executor=None):
+        self.missing(root)
+
 
 class TextMapper(GenericMapper):
     def __init__(self, *args, **kwargs):
@@ -100,11 +145,33 @@ class MemberMapper(GenericMapper):
             raise ValueError("Element must not be None")
         root.append(child)
 
+    def stream(self, data, writer):
+        # Children built by streaming factories are written directly,
+        # one item at a time
+        stream = getattr(self.factory, "stream", None)
+        if stream is None or self.source not in data:
+            return super(MemberMapper, self).stream(data, writer)
+
+        value = data[self.source]
+        if self.iterable_expected():
+            for item in self.items(value):
+                stream(item, writer)
+        else:
+            stream(value, writer)
+
+
+class UnknownKeyWarning(UserWarning):
+    pass
+
 
 class Mapper(object):
     def __init__(self):
         self.mappers = []
+        self.ignored = set()
         self.input_data = None
+        self.compiled = None
+        self.required = frozenset()
+        self.optional = frozenset()
 
     def add_attribute(self,
                       source,
@@ -160,17 +227,94 @@ class Mapper(object):
                    source,
                    arity='1',
                    default=Undefined(),
-                   factory=identity):
+                   factory=identity,
+                   concurrent=False):
         """
         """
         dest = None
-        mapper = MemberMapper(source, dest, arity, default, factory)
+        mapper = MemberMapper(source, dest, arity, default, factory, concurrent)
         self.mappers.append(mapper)
         return self
 
     def clear(self):
         self.mappers = []
 
+    def add_ignored(self, *sources):
+        """
+        Declares input keys consumed outside of the mapper, so that they
+        are not reported as unknown.
+        """
+        self.ignored.update(sources)
+        return self
+
+    def freeze(self, compile=True):
+        """
+        Prevents further mappers from being added, so that the mapper
+        can be safely shared, and compiles it unless told otherwise (the
+        interpreted path is easier to step through when debugging).
+        """
+        self.mappers = tuple(self.mappers)
+        if compile:
+            self.compiled = self.compile()
+
+    def compile(self):
+        """
+        Returns a function rendering data into a root element. Input keys
+        are dispatched in a single pass over the data, then each mapper
+        emits its value (or handles its absence) in declaration order.
+        Unknown input keys are reported with an UnknownKeyWarning. If an
+        executor is given, concurrent members are built through it.
+        """
+        steps = tuple(mapper.compile() for mapper in self.mappers)
+        count = len(steps)
+        concurrent = tuple(
+            mapper.emit if getattr(mapper, 'concurrent', False) else None
+            for mapper in self.mappers)
+
+        positions = {}
+        for position, mapper in enumerate(self.mappers):
+            source = getattr(mapper, 'source', None)
+            if source is not None:
+                positions.setdefault(source, []).append(position)
+
+        self.required = frozenset(
+            mapper.source for mapper in self.mappers
+            if isinstance(mapper, GenericMapper) and
+            not mapper.is_optional() and is_undefined(mapper.default))
+        self.optional = frozenset(positions) - self.required
+        ignored = frozenset(self.ignored)
+
+        def render(data, root, executor=None):
+            if not isinstance(data, dict):
+                raise ValueError("mapping input should be a dict (input = {})".format(data))
+
+            values = [Undefined] * count
+            unknown = []
+            for key, value in data.iteritems():
+                found = positions.get(key)
+                if found is None:
+                    if key not in ignored:
+                        unknown.append(key)
+                    continue
+                for position in found:
+                    values[position] = value
+
+            if unknown:
+                warnings.warn("unknown key(s) {} ignored (expected one of: {})".format(
+                    ", ".join(sorted(unknown)), ", ".join(sorted(positions))),
+                    UnknownKeyWarning)
+
+            for (emit, missing), threaded, value in itertools.izip(steps, concurrent, values):
+                if value is not Undefined:
+                    if executor is not None and threaded is not None:
+                        threaded(root, value, executor)
+                    else:
+                        emit(root, value)
+                elif missing is not None:
+                    missing(root)
+
+        return render
+
     def map(self, data):
         """
         """
@@ -186,4 +330,43 @@ class Mapper(object):
         if self.input_data is None:
             return
 
-        [mapper(self.input_data, root) for mapper in self.mappers]
+        self.render(self.input_data, root)
+
+    def stream(self, tag, data, writer):
+        """
+        Writes data as a tag element to a streaming writer. Attributes are
+        gathered first, then the other mappers write their content in
+        declaration order.
+        """
+        if not isinstance(data, dict):
+            raise ValueError("mapping input should be a dict (input = {})".format(data))
+
+        attributes = ETtree.Element(tag)
+        content = []
+        for mapper in self.mappers:
+            if isinstance(mapper, (AttributeMapper, StaticAttributeMapper)):
+                mapper(data, attributes)
+            else:
+                content.append(mapper)
+
+        writer.start(tag, attributes.attrib)
+        for mapper in content:
+            mapper.stream(data, writer)
+        writer.end(tag)
+
+    def render(self, data, root, executor=None):
+        """
+        Maps data into root without storing any state on the mapper, so
+        that a mapper can render several inputs concurrently. If an
+        executor (e.g. a thread pool) is given, the items of concurrent
+        members are built through its ordered imap.
+        """
+        if not isinstance(data, dict):
+            raise ValueError("mapping input should be a dict (input = {})".format(data))
+
+        if self.compiled is not None:
+            self.compiled(data, root, executor)
+            return
+
+        for mapper in self.mappers:
+            mapper(data, root, executor)
@@ -0,0 +1,204 @@
+import collections
+import re
+import types
+
+
+class Tags(object):
+    Rows = "rows"
+    Panels = "panels"
+    Items = "items"
+    Search = "search"
+    Searches = "searches"
+    Query = "query"
+    Base = "base"
+    Id = "id"
+    Ref = "ref"
+    Consolidate = "consolidateSearches"
+
+
+# Commands after which results are aggregated, so that they make good base
+# searches. Raw event searches are never consolidated, not even exact
+# duplicates: Splunk truncates the events of a non-transforming base
+# search and only passes the fields it names explicitly to post-process
+# searches, so that panels would silently show different results.
+TRANSFORMING_COMMANDS = frozenset([
+    "chart", "contingency", "geostats", "rare", "stats", "timechart",
+    "top", "tstats", "xyseries"])
+
+BASE_SEARCH_ID = "base_search_{}"
+
+
+class Report(object):
+    def __init__(self):
+        self.searches = 0
+        self.consolidated = 0
+        self.bases = 0
+
+    def removed(self):
+        """
+        Number of searches Splunk no longer runs as separate jobs.
+        """
+        return self.consolidated - self.bases
+
+    def to_dict(self):
+        return {"searches": self.searches,
+                "base_searches": self.bases,
+                "post_process_searches": self.consolidated,
+                "removed": self.removed()}
+
+
+def split_pipeline(query):
+    """
+    Splits a query on pipes that are not within quotes.
+    """
+    segments = []
+    current = []
+    quoted = False
+    escaped = False
+    for c in query:
+        if escaped:
+            escaped = False
+        elif c == "\\":
+            escaped = True
+        elif c == '"':
+            quoted = not quoted
+        elif c == "|" and not quoted:
+            segments.append("".join(current).strip())
+            current = []
+            continue
+        current.append(c)
+    segments.append("".join(current).strip())
+    return segments
+
+
+def command(segment):
+    match = re.match(r"\s*(\w+)", segment)
+    return match.group(1).lower() if match else None
+
+
+def split_query(query):
+    """
+    Splits a query into its prefix up to the first transforming command
+    and the remaining post-processing commands. Returns None if the query
+    has no transforming command.
+    """
+    segments = split_pipeline(query)
+    for i, segment in enumerate(segments):
+        if command(segment) in TRANSFORMING_COMMANDS:
+            return " | ".join(segments[:i + 1]), segments[i + 1:]
+    return None
+
+
+def iter_searches(dashboard):
+    """
+    Yields (owner, key) pairs for every search held by a panel or a
+    visualization.
+    """
+    for row in dashboard.get(Tags.Rows, []):
+        for panel in row.get(Tags.Panels, []):
+            if Tags.Search in panel:
+                yield panel, Tags.Search
+            for item in panel.get(Tags.Items, []):
+                for visualization in item.itervalues():
+                    if isinstance(visualization, dict) and Tags.Search in visualization:
+                        yield visualization, Tags.Search
+
+
+def search_ids(dashboard):
+    ids = set()
+    for owner, key in iter_searches(dashboard):
+        if isinstance(owner[key], dict) and Tags.Id in owner[key]:
+            ids.add(owner[key][Tags.Id])
+    for search in dashboard.get(Tags.Searches, []):
+        ids.add(search.get(Tags.Id))
+    return ids
+
+
+def copy_tree(data):
+    """
+    Copies dicts and lists of a parsed dashboard, so that rewriting it
+    never modifies subtrees shared by the parser.
+    """
+    if isinstance(data, dict):
+        return dict((k, copy_tree(v)) for k, v in data.iteritems())
+    if isinstance(data, (list, types.GeneratorType)):
+        return [copy_tree(item) for item in data]
+    return data
+
+
+def group_key(search):
+    """
+    Returns the key of the searches sharing a base search with this one,
+    or None if it cannot be consolidated.
+    """
+    if not isinstance(search, dict) or Tags.Query not in search:
+        return None
+
+    if any(k in search for k in (Tags.Base, Tags.Id, Tags.Ref)):
+        return None
+
+    split = split_query(search[Tags.Query])
+    if split is None:
+        return None
+
+    prefix, _ = split
+    settings = tuple(sorted((k, v) for k, v in search.iteritems() if k != Tags.Query))
+    return prefix, settings
+
+
+def consolidate_searches(data, force=False):
+    """
+    Rewrites searches sharing the same query prefix (up to the first
+    transforming command) and the same settings into a global base search
+    and post-process searches. Only applies to dashboards with
+    'consolidateSearches' set, unless force is True. Returns the new data
+    and a report.
+    """
+    report = Report()
+    t, dashboard = data.items()[0]
+
+    if not (dashboard.get(Tags.Consolidate, False) or force):
+        if Tags.Consolidate in dashboard:
+            dashboard = dict(dashboard)
+            del dashboard[Tags.Consolidate]
+        return {t: dashboard}, report
+
+    dashboard = copy_tree(dashboard)
+    dashboard.pop(Tags.Consolidate, None)
+    data = {t: dashboard}
+    used_ids = search_ids(dashboard)
+
+    groups = collections.OrderedDict()
+    for owner, key in iter_searches(dashboard):
+        report.searches += 1
+        k = group_key(owner[key])
+        if k is not None:
+            groups.setdefault(k, []).append(owner)
+
+    bases = []
+    for (prefix, settings), owners in groups.iteritems():
+        if len(owners) < 2:
+            continue
+
+        base_id = BASE_SEARCH_ID.format(len(bases) + 1)
+        while base_id in used_ids:
+            base_id += "_"
+        used_ids.add(base_id)
+        base = dict(settings)
+        base[Tags.Id] = base_id
+        base[Tags.Query] = prefix
+        bases.append(base)
+
+        for owner in owners:
+            _, rest = split_query(owner[Tags.Search][Tags.Query])
+            post_process = {Tags.Base: base_id}
+            if rest:
+                post_process[Tags.Query] = "| " + " | ".join(rest)
+            owner[Tags.Search] = post_process
+
+        report.consolidated += len(owners)
+
+    if bases:
+        dashboard[Tags.Searches] = dashboard.get(Tags.Searches, []) + bases
+    report.bases = len(bases)
+    return data, report
@@ -1,5 +1,8 @@
+import collections
 import itertools
+import multiprocessing
 import re
+import threading
 
 
 class Tags(object):
@@ -17,44 +20,170 @@ def value_at_path(data, path):
     return current
 
 
-def expand_str(s, store):
-    new = str(s)
-    replaced = set()
-    while True:
-        match = re.search(r"\{([^\}]+)\}", new)
-        if not match:
-            return new
+class Scope(object):
+    """
+    Layered store of template arguments. Each template level adds a scope
+    chained to the enclosing one instead of copying it, and resolved paths
+    are cached on the scope defining them.
+    """
+    def __init__(self, values, parent=None):
+        self.values = values
+        self.parent = parent
+        self.cache = {}
+
+    def __contains__(self, name):
+        scope = self
+        while scope is not None:
+            if name in scope.values:
+                return True
+            scope = scope.parent
+        return False
+
+    def __getitem__(self, name):
+        scope = self
+        while scope is not None:
+            if name in scope.values:
+                return scope.values[name]
+            scope = scope.parent
+        raise KeyError(name)
+
+    def owner(self, name):
+        scope = self
+        while scope is not None:
+            if name in scope.values:
+                return scope
+            scope = scope.parent
+        raise KeyError(name)
+
+    def lookup(self, name, path):
+        if name in self.cache:
+            return self.cache[name]
+
+        # Cached on the scope defining the argument, so that the entry is
+        # shared by every combination of the nested scopes
+        owner = self.owner(path[0])
+        if name not in owner.cache:
+            owner.cache[name] = value_at_path(owner.values, path)
+
+        self.cache[name] = owner.cache[name]
+        return self.cache[name]
+
+
+def as_scope(store):
+    if isinstance(store, Scope):
+        return store
+    return Scope(store)
+
+
+class Placeholder(object):
+    def __init__(self, name):
+        self.name = name
+        self.path = name.split(":")
+
+
+PLACEHOLDER_RE = re.compile(r"\{([^\}]+)\}")
+
+
+class TemplateCache(object):
+    """
+    Bounded LRU cache of compiled templates, keyed by string. Templates
+    are tuples, so they are shared by every caller.
+    """
+    def __init__(self, compile, maxsize=4096):
+        self.compile = compile
+        self.maxsize = maxsize
+        self.templates = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, s):
+        with self.lock:
+            template = self.templates.pop(s, None)
+            if template is not None:
+                self.templates[s] = template
+                return template
+
+        template = self.compile(s)
+        with self.lock:
+            self.templates[s] = template
+            while len(self.templates) > self.maxsize:
+                self.templates.popitem(last=False)
+        return template
+
+    def __len__(self):
+        return len(self.templates)
+
+
+def compile_template(s):
+    """
+    Splits a string into a tuple of literal strings and placeholders.
+    """
+    segments = []
+    position = 0
+    for match in PLACEHOLDER_RE.finditer(s):
+        if match.start() > position:
+            segments.append(s[position:match.start()])
+        segments.append(Placeholder(match.group(1)))
+        position = match.end()
+
+    if position < len(s):
+        segments.append(s[position:])
+
+    return tuple(segments)
+
+
+COMPILED_TEMPLATES = TemplateCache(compile_template)
+
+
+def compile_str(s):
+    """
+    Returns the compiled template of a string. Results are cached, so
+    each distinct string is usually only scanned once.
+    """
+    return COMPILED_TEMPLATES.get(s)
+
 
-        found = match.group(1)
+def render_template(template, store, replaced=()):
+    parts = []
+    for segment in template:
+        if not isinstance(segment, Placeholder):
+            parts.append(segment)
+            continue
 
-        if found in replaced:
-            raise RuntimeError("infinite argument substitution detected (with argument = '{}')".format(found))
+        if segment.name in replaced:
+            raise RuntimeError("infinite argument substitution detected (with argument = '{}')".format(segment.name))
 
-        path = found.split(":")
-        new = new.replace("{" + found + "}", str(value_at_path(store, path)))
-        replaced.add(found)
+        value = str(store.lookup(segment.name, segment.path))
+        if "{" in value:
+            value = render_template(compile_str(value), store, replaced + (segment.name,))
+        parts.append(value)
+
+    return "".join(parts)
+
+
+def expand_str(s, store):
+    return render_template(compile_str(str(s)), as_scope(store))
 
 
-def parse_dict(data, store):
+def parse_dict(data, store, context):
     new = {}
-    if len(data) == 1 and data.keys()[0] == Tags.Template:
-        return build_template(data[Tags.Template], store)
+    if is_template(data):
+        return build_template(data[Tags.Template], store, context)
     else:
         for k, v in data.iteritems():
-            new[k] = parse(v, store)
+            new[k] = parse(v, store, context)
     return new
 
 
-def parse_str(data, store):
+def parse_str(data, store, _):
     return expand_str(str(data), store)
 
 
-def parse_list(data, store):
-    return [parse(item, store) for item in data]
+def parse_list(data, store, context):
+    return [parse(item, store, context) for item in data]
 
 
-def parse_any(data, _):
-    return False, data
+def parse_any(data, store, _):
+    return data
 
 
 def handlers():
@@ -70,7 +199,41 @@ def dict_product(dicts):
             for x in itertools.product(*dicts.itervalues()))
 
 
-def build_template(data, store):
+def expand_template(body, arguments, store, context):
+    for args_set in dict_product(arguments):
+        yield parse(body, Scope(args_set, store), context)
+
+
+def parse_chunk(job):
+    body, chunk, memoize = job
+    context = Context(memoize=memoize)
+    return [parse(body, scope, context) for scope in chunk]
+
+
+def expand_template_parallel(body, arguments, store, context):
+    """
+    Expands the combinations of arguments in a pool of processes. Chunks are
+    mapped in order, so that results are the same as with expand_template.
+    """
+    combinations = []
+    for args_set in dict_product(arguments):
+        combinations.append(Scope(args_set, store))
+
+    chunk_size = max(1, len(combinations) // (context.jobs * 4))
+    jobs = [(body, combinations[i:i + chunk_size], context.memoize)
+            for i in xrange(0, len(combinations), chunk_size)]
+
+    pool = multiprocessing.Pool(context.jobs)
+    try:
+        chunks = pool.map(parse_chunk, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+    return [result for chunk in chunks for result in chunk]
+
+
+def build_template(data, store, context):
     is_simple_template = True
     arguments = data.get(Tags.Arguments, {})
 
@@ -88,24 +251,151 @@ def build_template(data, store):
     if Tags.Body not in data:
         raise ValueError("missing 'body' attribute in template (in template = {})".format(data))
 
-    results = []
-    for args_set in dict_product(arguments):
-        args_set.update(store)
-        results.append(parse(data[Tags.Body], args_set))
+    if not is_simple_template and context.jobs > 1:
+        return expand_template_parallel(data[Tags.Body], arguments, store, context)
+
+    results = expand_template(data[Tags.Body], arguments, store, context)
 
     if is_simple_template:
-        assert len(results) == 1
-        return results[0]
+        return next(results)
+
+    if context.lazy:
+        return results
+
+    return list(results)
+
+
+def is_template(data):
+    return len(data) == 1 and data.keys()[0] == Tags.Template
+
 
-    return results
+def str_references(s):
+    return set(segment.path[0]
+               for segment in compile_str(s)
+               if isinstance(segment, Placeholder))
+
+
+class Analysis(object):
+    def __init__(self, references, has_template):
+        self.references = frozenset(references)
+        self.has_template = has_template
+
+
+def analyze(data, cache):
+    """
+    Returns the names of the arguments referenced by a subtree, and whether
+    the subtree contains a template. Results are cached by subtree identity.
+    """
+    if isinstance(data, str):
+        return Analysis(str_references(data), False)
+
+    if not isinstance(data, (dict, list)):
+        return Analysis((), False)
+
+    key = id(data)
+    if key in cache:
+        return cache[key]
+
+    references = set()
+    has_template = False
+
+    if isinstance(data, dict) and is_template(data):
+        template = data[Tags.Template]
+        arguments = template.get(Tags.Arguments, {})
+        references.update(analyze(template.get(Tags.Body), cache).references)
+        for values in arguments.itervalues():
+            references.update(analyze(values, cache).references)
+        references.difference_update(arguments)
+        has_template = True
+    else:
+        children = data.itervalues() if isinstance(data, dict) else data
+        for child in children:
+            analysis = analyze(child, cache)
+            references.update(analysis.references)
+            has_template = has_template or analysis.has_template
+
+    result = Analysis(references, has_template)
+    cache[key] = result
+    return result
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.iteritems()))
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def memo_key(data, store, context):
+    """
+    Builds the memoization key of a subtree from its identity and the values
+    of the arguments it references, following references made by argument
+    values themselves. Returns None if a referenced argument is missing.
+    """
+    values = []
+    seen = set()
+    pending = list(analyze(data, context.analysis).references)
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+
+        if name not in store:
+            return None
+
+        value = store[name]
+        values.append((name, freeze(value)))
+        pending.extend(analyze(value, context.analysis).references)
+
+    return id(data), tuple(sorted(values))
+
+
+def parse_memoized(handler, data, store, context):
+    if context.lazy and analyze(data, context.analysis).has_template:
+        return handler(data, store, context)
+
+    key = memo_key(data, store, context)
+    if key is None:
+        return handler(data, store, context)
+
+    if key not in context.memo:
+        context.memo[key] = handler(data, store, context)
+    return context.memo[key]
+
+
+class Context(object):
+    def __init__(self, lazy=False, memoize=False, jobs=1):
+        # In lazy mode, templates expand to generators which are consumed
+        # by the factories, so that only one branch of the expansion tree
+        # is held in memory at a time.
+        self.lazy = lazy
+
+        # When memoizing, subtrees are only expanded once for each set of
+        # values of the arguments they reference; the resulting objects are
+        # shared and must not be mutated.
+        self.memoize = memoize
+        self.analysis = {}
+        self.memo = {}
+
+        # With more than one job, the outermost multi-valued template is
+        # expanded in a pool of processes (nested templates are expanded
+        # serially by the workers). This takes precedence over lazy mode.
+        self.jobs = jobs
 
 
 def get_handler(t):
     return handlers().get(t, parse_any)
 
 
-def parse(data, store=None):
+def parse(data, store=None, context=None):
     if store is None:
         store = {}
-    handler = handlers()[type(data)]
-    return handler(data, store)
+    store = as_scope(store)
+    if context is None:
+        context = Context()
+    handler = get_handler(type(data))
+    if context.memoize and isinstance(data, (dict, list)):
+        return parse_memoized(handler, data, store, context)
+    return handler(data, store, context)
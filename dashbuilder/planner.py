@@ -0,0 +1,109 @@
+import parser
+
+
+class Tags(object):
+    Panels = "panels"
+    Search = "search"
+
+
+class Estimate(object):
+    def __init__(self, panels=0, searches=0, size=0):
+        self.panels = panels
+        self.searches = searches
+        self.size = size
+
+    def __add__(self, other):
+        return Estimate(self.panels + other.panels,
+                        self.searches + other.searches,
+                        self.size + other.size)
+
+    def __mul__(self, n):
+        return Estimate(self.panels * n,
+                        self.searches * n,
+                        self.size * n)
+
+    def to_dict(self):
+        return {"panels": self.panels,
+                "searches": self.searches,
+                "bytes": self.size}
+
+
+class Limits(object):
+    def __init__(self, max_panels=None, max_searches=None, max_size=None):
+        self.max_panels = max_panels
+        self.max_searches = max_searches
+        self.max_size = max_size
+
+    def violations(self, estimate):
+        checks = [("panels", estimate.panels, self.max_panels),
+                  ("searches", estimate.searches, self.max_searches),
+                  ("bytes", estimate.size, self.max_size)]
+        return ["estimated {} {} exceeds limit {}".format(value, name, limit)
+                for name, value, limit in checks
+                if limit is not None and value > limit]
+
+
+def cardinality(arguments):
+    n = 1
+    for values in arguments.itervalues():
+        if isinstance(values, list):
+            n *= len(values)
+    return n
+
+
+def count_items(data):
+    """
+    Returns the number of items a node expands to when used as a list.
+    """
+    if isinstance(data, list):
+        return len(data)
+
+    if isinstance(data, dict) and parser.is_template(data):
+        template = data[parser.Tags.Template]
+        arguments = template.get(parser.Tags.Arguments, {})
+        if any(isinstance(values, list) for values in arguments.itervalues()):
+            return cardinality(arguments)
+        return count_items(template.get(parser.Tags.Body))
+
+    return 1
+
+
+def estimate(data):
+    """
+    Estimates the size of the dashboard generated from data, without
+    expanding its templates.
+    """
+    if isinstance(data, list):
+        return sum((estimate(item) for item in data), Estimate())
+
+    if isinstance(data, dict):
+        if parser.is_template(data):
+            template = data[parser.Tags.Template]
+            arguments = template.get(parser.Tags.Arguments, {})
+            return estimate(template.get(parser.Tags.Body)) * cardinality(arguments)
+
+        result = Estimate()
+        for k, v in data.iteritems():
+            # Each key is roughly emitted as an opening and a closing tag
+            result += estimate(v) + Estimate(size=2 * len(k) + 5)
+            if k == Tags.Panels:
+                result += Estimate(panels=count_items(v))
+            elif k == Tags.Search:
+                result += Estimate(searches=count_items(v))
+        return result
+
+    if data is None:
+        return Estimate()
+
+    return Estimate(size=len(str(data)))
+
+
+def check_limits(data, limits):
+    """
+    Raises a ValueError if the estimated size of the dashboard generated
+    from data exceeds the limits.
+    """
+    violations = limits.violations(estimate(data))
+    if violations:
+        raise ValueError("dashboard expansion aborted: {}".format(
+            "; ".join(violations)))
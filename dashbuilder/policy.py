@@ -0,0 +1,224 @@
+import re
+
+import loader
+import optimizer
+
+
+class Tags(object):
+    Rules = "rules"
+    Name = "name"
+    Match = "match"
+    Defaults = "defaults"
+    Clamp = "clamp"
+    Query = "query"
+    Panel = "panel"
+    MinRange = "min_range"
+    MaxRange = "max_range"
+    Min = "min"
+    Max = "max"
+    Earliest = "earliest"
+    Latest = "latest"
+    Policy = "policy"
+    Rows = "rows"
+    Panels = "panels"
+    Items = "items"
+    Search = "search"
+    Searches = "searches"
+
+
+UNITS = {
+    "s": 1, "sec": 1, "secs": 1, "second": 1, "seconds": 1,
+    "m": 60, "min": 60, "mins": 60, "minute": 60, "minutes": 60,
+    "h": 3600, "hr": 3600, "hrs": 3600, "hour": 3600, "hours": 3600,
+    "d": 86400, "day": 86400, "days": 86400,
+    "w": 604800, "week": 604800, "weeks": 604800,
+    "mon": 2592000, "month": 2592000, "months": 2592000,
+    "y": 31536000, "year": 31536000, "years": 31536000,
+}
+
+DURATION_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([a-z]*)\s*$")
+RELATIVE_TIME_RE = re.compile(r"^-(\d*)([a-z]+)(@[a-z0-9]+)?$")
+
+
+def parse_duration(value):
+    """
+    Returns a duration (e.g. 30, '30s', '5m') in seconds, or None if it
+    cannot be parsed.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+
+    match = DURATION_RE.match(str(value))
+    if not match:
+        return None
+
+    n, unit = match.groups()
+    if unit and unit not in UNITS:
+        return None
+    return float(n) * UNITS.get(unit, 1)
+
+
+def relative_seconds(value):
+    """
+    Returns how far in the past a Splunk time modifier is, in seconds, or
+    None if it is not a relative time (e.g. a token or an epoch).
+    """
+    if value is None or value == "now":
+        return 0
+
+    # Earliest time 0 stands for all time
+    if str(value) == "0":
+        return float("inf")
+
+    match = RELATIVE_TIME_RE.match(str(value))
+    if not match:
+        return None
+
+    n, unit, _ = match.groups()
+    if unit not in UNITS:
+        return None
+    return int(n or 1) * UNITS[unit]
+
+
+def time_range(search):
+    earliest = relative_seconds(search.get(Tags.Earliest))
+    latest = relative_seconds(search.get(Tags.Latest))
+    if earliest is None or latest is None or Tags.Earliest not in search:
+        return None
+    return earliest - latest
+
+
+class Rule(object):
+    def __init__(self, data):
+        self.name = data.get(Tags.Name, "unnamed")
+
+        match = data.get(Tags.Match, {})
+        self.query = match.get(Tags.Query)
+        if self.query is not None:
+            self.query = re.compile(self.query)
+
+        panels = match.get(Tags.Panel)
+        if panels is not None and not isinstance(panels, list):
+            panels = [panels]
+        self.panels = panels
+
+        self.min_range = match.get(Tags.MinRange)
+        if self.min_range is not None:
+            self.min_range = parse_duration(self.min_range)
+        self.max_range = match.get(Tags.MaxRange)
+        if self.max_range is not None:
+            self.max_range = parse_duration(self.max_range)
+
+        self.defaults = data.get(Tags.Defaults, {})
+        self.clamp = data.get(Tags.Clamp, {})
+
+    def matches(self, kind, search):
+        if self.panels is not None and kind not in self.panels:
+            return False
+
+        if self.query is not None and not self.query.search(search.get(Tags.Query, "")):
+            return False
+
+        if self.min_range is not None or self.max_range is not None:
+            seconds = time_range(search)
+            if seconds is None:
+                return False
+            if self.min_range is not None and seconds < self.min_range:
+                return False
+            if self.max_range is not None and seconds > self.max_range:
+                return False
+
+        return True
+
+
+class Change(object):
+    def __init__(self, location, rule, key, before, after):
+        self.location = location
+        self.rule = rule
+        self.key = key
+        self.before = before
+        self.after = after
+
+    def __str__(self):
+        if self.before is None:
+            return "{}: set {} to {} (rule '{}')".format(
+                self.location, self.key, self.after, self.rule)
+        return "{}: changed {} from {} to {} (rule '{}')".format(
+            self.location, self.key, self.before, self.after, self.rule)
+
+
+def load_rules(path):
+    return [Rule(rule) for rule in loader.load_yaml_file(path).get(Tags.Rules, [])]
+
+
+def iter_searches(dashboard):
+    """
+    Yields (location, kind, owner) for every search of the dashboard, kind
+    being the visualization type for searches of visualizations.
+    """
+    if isinstance(dashboard.get(Tags.Search), dict):
+        yield "search", "dashboard", dashboard
+
+    for i, search in enumerate(dashboard.get(Tags.Searches, [])):
+        yield "searches[{}]".format(i), "dashboard", {Tags.Search: search}
+
+    for r, row in enumerate(dashboard.get(Tags.Rows, [])):
+        for p, panel in enumerate(row.get(Tags.Panels, [])):
+            location = "rows[{}].panels[{}]".format(r, p)
+            if isinstance(panel.get(Tags.Search), dict):
+                yield location + ".search", "panel", panel
+
+            for i, item in enumerate(panel.get(Tags.Items, [])):
+                for t, visualization in item.iteritems():
+                    if isinstance(visualization, dict) and isinstance(visualization.get(Tags.Search), dict):
+                        yield "{}.items[{}].{}.search".format(location, i, t), t, visualization
+
+
+def clamp(value, bounds):
+    seconds = parse_duration(value)
+    if seconds is None:
+        return value
+
+    if Tags.Min in bounds and seconds < parse_duration(bounds[Tags.Min]):
+        return bounds[Tags.Min]
+    if Tags.Max in bounds and seconds > parse_duration(bounds[Tags.Max]):
+        return bounds[Tags.Max]
+    return value
+
+
+def apply_rule(rule, location, search, changes):
+    for key, value in rule.defaults.iteritems():
+        if key not in search:
+            search[key] = value
+            changes.append(Change(location, rule.name, key, None, value))
+
+    for key, bounds in rule.clamp.iteritems():
+        if key not in search:
+            continue
+        value = clamp(search[key], bounds)
+        if value != search[key]:
+            changes.append(Change(location, rule.name, key, search[key], value))
+            search[key] = value
+
+
+def apply_policies(data, rules):
+    """
+    Applies policy rules to every search of a parsed dashboard, in order.
+    Defaults only fill settings the author left out, clamps bound the
+    values that are set. Searches with 'policy: false' are left untouched.
+    Returns the new data and the list of changes.
+    """
+    changes = []
+    t, dashboard = data.items()[0]
+    dashboard = optimizer.copy_tree(dashboard)
+
+    for location, kind, owner in iter_searches(dashboard):
+        search = owner[Tags.Search]
+        if not search.pop(Tags.Policy, True):
+            continue
+
+        for rule in rules:
+            if rule.matches(kind, search):
+                apply_rule(rule, location, search, changes)
+
+    return {t: dashboard}, changes
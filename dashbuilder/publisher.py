@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib2
+import xml.etree.ElementTree as ETtree
+
+import writer
+
+
+class PublishManifest(object):
+    """
+    Hashes of the dashboards last published to each server and app, so
+    that unchanged dashboards are skipped without any request.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path) as fp:
+                self.entries = json.load(fp)
+        except (IOError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def key(server, app, dashboard):
+        return "{}/{}/{}".format(server, app, dashboard)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+        return entry["hash"] if entry is not None else None
+
+    def put(self, key, digest):
+        with self.lock:
+            self.entries[key] = {"hash": digest, "published": time.time()}
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        with self.lock:
+            fd, tmp = tempfile.mkstemp(dir=directory or ".")
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(self.entries, fp, indent=2, sort_keys=True)
+        os.rename(tmp, self.path)
+
+
+def dashboard_hash(data):
+    """
+    Returns the content hash of an xml dashboard, which does not depend on
+    its layout (see writer.content_hash).
+    """
+    # Remote dashboards are unicode, which fromstring only parses as ascii
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    return writer.content_hash(ETtree.fromstring(data))
+
+
+def remote_hash(dashboards, app, dashboard):
+    """
+    Returns the content hash of a published dashboard, or None if it does
+    not exist or cannot be parsed.
+    """
+    try:
+        return dashboard_hash(dashboards.get(app, dashboard))
+    except urllib2.HTTPError as e:
+        if e.code == 404:
+            return None
+        raise
+    except (ETtree.ParseError, AttributeError):
+        return None
+
+
+def publish(client, app, dashboard, data, manifest=None, skip_unchanged=False):
+    """
+    Creates or updates a dashboard. With skip_unchanged, dashboards matching
+    the manifest, or else the published dashboard, are left untouched,
+    unless the listing of the app shows they no longer exist.
+    Returns 'created', 'updated' or 'unchanged'.
+    """
+    dashboards = client.dashboards()
+    digest = dashboard_hash(data)
+    key = PublishManifest.key(client.context.server.api(), app, dashboard)
+
+    # Dashboards missing from the listing of the app were deleted since
+    # they were recorded in the manifest
+    if skip_unchanged and dashboards.exists_cached(app, dashboard) is not False:
+        if manifest is not None and manifest.get(key) == digest:
+            return "unchanged"
+
+        if remote_hash(dashboards, app, dashboard) == digest:
+            if manifest is not None:
+                manifest.put(key, digest)
+            return "unchanged"
+
+    action = dashboards.upsert(app, dashboard, data)
+    if manifest is not None:
+        manifest.put(key, digest)
+    return action
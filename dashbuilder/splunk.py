@@ -1,15 +1,36 @@
 import urllib2
 import urllib
 import urlparse
-import base64
+import errno
+import httplib
+import json
+import os
+import random
+import socket
 import ssl
+import StringIO
+import tempfile
+import threading
+import time
 import xml.etree.ElementTree as ETtree
 
 
-def auth_header(username, password):
-    base64auth = base64.encodestring('{}:{}'.format(username, password)).replace('\n', '')
-    header = ("Authorization", "Basic {}".format(base64auth))
-    return header
+LOGIN_PATH = "services/auth/login"
+
+# Splunk expires idle sessions after an hour by default
+SESSION_TTL = 45 * 60
+
+# Statuses of requests the server did not process, which are always safe
+# to send again
+REJECTED_STATUSES = frozenset([429, 503])
+
+# Statuses of requests that may have been processed, only sent again when
+# the call is retry-safe
+FAILED_STATUSES = frozenset([500, 502, 504])
+
+
+def session_header(session_key):
+    return ("Authorization", "Splunk {}".format(session_key))
 
 
 def no_ssl_check():
@@ -30,6 +51,16 @@ class ServerInfo(object):
     def api(self):
         return "{}:{}".format(self.addr, self.port)
 
+    def url(self):
+        """
+        Base url of the REST API. The management port serves https, which
+        is assumed when the address has no scheme.
+        """
+        api = self.api()
+        if "://" not in api:
+            api = "https://" + api
+        return api + "/"
+
 
 class AuthenticationInfo(object):
     def __init__(self, username=None, password=None):
@@ -37,27 +68,526 @@ class AuthenticationInfo(object):
         self.password = password
 
 
+class Response(object):
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def read(self):
+        return self.body
+
+
+def http_error(url, response):
+    return urllib2.HTTPError(url, response.status, response.reason,
+                             response.headers, StringIO.StringIO(response.body))
+
+
+def is_stale(error):
+    """
+    Returns whether an error raised while waiting for a response means the
+    server closed the connection without any response, as it does with
+    idle connections.
+    """
+    if isinstance(error, socket.timeout):
+        return False
+    if isinstance(error, httplib.BadStatusLine):
+        return not error.line or error.line == "''" or error.line.startswith("No status line")
+    return error.errno == errno.ECONNRESET
+
+
+class Transport(object):
+    """
+    HTTP transport keeping connections open across requests. Idle
+    connections are pooled by scheme and host, so that concurrent callers
+    each get their own connection and later calls skip the TCP and TLS
+    handshakes.
+    """
+    def __init__(self, timeout=60, maxsize=8, max_per_host=None):
+        self.timeout = timeout
+        self.maxsize = maxsize
+        self.max_per_host = max_per_host
+        self.pools = {}
+        self.limits = {}
+        self.lock = threading.Lock()
+        self.connections = 0
+
+    def limit(self, key):
+        """
+        Returns the semaphore bounding the number of concurrent requests
+        to a host, if any.
+        """
+        if self.max_per_host is None:
+            return None
+        with self.lock:
+            if key not in self.limits:
+                self.limits[key] = threading.BoundedSemaphore(self.max_per_host)
+            return self.limits[key]
+
+    def connect(self, scheme, netloc):
+        with self.lock:
+            self.connections += 1
+        if scheme == "https":
+            return httplib.HTTPSConnection(netloc, timeout=self.timeout, context=no_ssl_check())
+        return httplib.HTTPConnection(netloc, timeout=self.timeout)
+
+    def acquire(self, key):
+        with self.lock:
+            pool = self.pools.get(key)
+            if pool:
+                return pool.pop(), True
+        return self.connect(*key), False
+
+    def release(self, key, connection):
+        with self.lock:
+            pool = self.pools.setdefault(key, [])
+            if len(pool) < self.maxsize:
+                pool.append(connection)
+                return
+        connection.close()
+
+    def request(self, verb, url, body=None, headers=None):
+        parts = urlparse.urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = urlparse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+
+        limit = self.limit(key)
+        if limit is None:
+            return self.send(key, verb, path, body, headers)
+        with limit:
+            return self.send(key, verb, path, body, headers)
+
+    def send(self, key, verb, path, body, headers):
+        while True:
+            connection, reused = self.acquire(key)
+            try:
+                try:
+                    connection.request(verb, path, body, headers or {})
+                except socket.timeout:
+                    raise
+                except socket.error:
+                    # The request was not delivered: the server closed the
+                    # idle connection
+                    if reused:
+                        connection.close()
+                        continue
+                    raise
+
+                try:
+                    response = connection.getresponse()
+                except (httplib.BadStatusLine, socket.error) as e:
+                    if reused and is_stale(e):
+                        connection.close()
+                        continue
+                    raise
+
+                data = response.read()
+            except (httplib.HTTPException, socket.error):
+                # Anything else may happen after the request was processed,
+                # only callers know whether it is safe to send it again
+                connection.close()
+                raise
+
+            if response.will_close:
+                connection.close()
+            else:
+                self.release(key, connection)
+
+            return Response(response.status, response.reason,
+                            dict(response.getheaders()), data)
+
+    def close(self):
+        with self.lock:
+            pools, self.pools = self.pools, {}
+        for pool in pools.itervalues():
+            for connection in pool:
+                connection.close()
+
+
+class SessionCache(object):
+    """
+    Session keys stored on disk, so that successive runs reuse the same
+    session instead of logging in again. Keys older than ttl seconds are
+    ignored.
+    """
+    def __init__(self, path, ttl=SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+
+    def read(self):
+        try:
+            with open(self.path, 'rb') as fp:
+                return json.load(fp)
+        except (IOError, ValueError):
+            return {}
+
+    def write(self, sessions):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # mkstemp creates files only readable by their owner
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as fp:
+            json.dump(sessions, fp)
+        os.rename(tmp, self.path)
+
+    def get(self, key):
+        session = self.read().get(key)
+        if session is None or time.time() - session["created"] > self.ttl:
+            return None
+        return session["key"]
+
+    def put(self, key, session_key):
+        sessions = self.read()
+        now = time.time()
+        sessions = dict((k, v) for k, v in sessions.iteritems()
+                        if now - v["created"] <= self.ttl)
+        sessions[key] = {"key": session_key, "created": now}
+        self.write(sessions)
+
+    def discard(self, key):
+        sessions = self.read()
+        if sessions.pop(key, None) is not None:
+            self.write(sessions)
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class RetryPolicy(object):
+    """
+    Exponential backoff with full jitter: the n-th retry waits a random
+    delay between 0 and min(max_backoff, backoff * 2 ** n) seconds, or
+    the delay asked by a Retry-After header if longer.
+    """
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class TokenBucket(object):
+    """
+    Allows rate requests per second on average, with bursts of up to burst
+    requests.
+    """
+    def __init__(self, rate, burst=1, clock=time.time, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(burst)
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token and returns how long to wait before it is available.
+        """
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            self.sleep(wait)
+
+
+class CircuitBreaker(object):
+    """
+    Fails calls to a server at once after threshold consecutive failures.
+    After reset_timeout seconds, a single trial call is let through: the
+    circuit closes again if it succeeds.
+    """
+    def __init__(self, threshold=5, reset_timeout=30, clock=time.time):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened is None:
+                return True
+            if self.trial or self.clock() - self.opened < self.reset_timeout:
+                return False
+            self.trial = True
+            return True
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                self.opened = self.clock()
+            self.trial = False
+
+
+class Stats(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+        self.latencies = []
+
+    def record(self, latency, failed):
+        with self.lock:
+            self.requests += 1
+            self.latencies.append(latency)
+            if failed:
+                self.failures += 1
+
+    def to_dict(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = {"requests": self.requests,
+                     "retries": self.retries,
+                     "failures": self.failures,
+                     "rejected_by_circuit_breaker": self.rejected}
+
+        if latencies:
+            stats["latency"] = {
+                "mean": sum(latencies) / len(latencies),
+                "p50": latencies[len(latencies) // 2],
+                "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                "max": latencies[-1]}
+        return stats
+
+
+def retry_after(response):
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class Scheduler(object):
+    """
+    Sends requests through a transport, rate limited by a token bucket and
+    guarded by a circuit breaker for each server. Requests the server did
+    not process are retried with backoff. Connection errors and other
+    server errors are only retried for retry-safe calls, since the request
+    may have been processed.
+    """
+    def __init__(self, transport, policy=None, rate=None, burst=1,
+                 threshold=5, reset_timeout=30, clock=time.time, sleep=time.sleep):
+        self.transport = transport
+        self.policy = policy or RetryPolicy()
+        self.rate = rate
+        self.burst = burst
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.sleep = sleep
+        self.buckets = {}
+        self.breakers = {}
+        self.lock = threading.Lock()
+        self.stats = Stats()
+
+    def server(self, url):
+        """
+        Returns the token bucket and the circuit breaker of the server of
+        an url.
+        """
+        netloc = urlparse.urlsplit(url).netloc
+        with self.lock:
+            if netloc not in self.breakers:
+                self.breakers[netloc] = CircuitBreaker(self.threshold, self.reset_timeout, self.clock)
+                if self.rate is not None:
+                    self.buckets[netloc] = TokenBucket(self.rate, self.burst, self.clock, self.sleep)
+            return self.buckets.get(netloc), self.breakers[netloc]
+
+    def attempt(self, bucket, breaker, verb, url, body, headers):
+        if not breaker.allow():
+            with self.stats.lock:
+                self.stats.rejected += 1
+            raise CircuitOpenError("too many failed requests to {}".format(urlparse.urlsplit(url).netloc))
+
+        if bucket is not None:
+            bucket.acquire()
+
+        start = self.clock()
+        try:
+            response = self.transport.request(verb, url, body, headers)
+        except (httplib.HTTPException, socket.error):
+            self.stats.record(self.clock() - start, True)
+            breaker.failure()
+            raise
+
+        # Rate limiting (429) is not a sign of an unhealthy server
+        failed = response.status >= 500
+        self.stats.record(self.clock() - start, failed)
+        if failed:
+            breaker.failure()
+        else:
+            breaker.success()
+        return response
+
+    def request(self, verb, url, body=None, headers=None, retry=False):
+        """
+        Sends a request and returns the last response. retry tells whether
+        the call can safely be sent again after it may have been processed.
+        """
+        bucket, breaker = self.server(url)
+        attempt = 0
+        while True:
+            try:
+                response = self.attempt(bucket, breaker, verb, url, body, headers)
+            except (httplib.HTTPException, socket.error):
+                if not retry or attempt >= self.policy.retries:
+                    raise
+                delay = self.policy.delay(attempt)
+            else:
+                retriable = (response.status in REJECTED_STATUSES or
+                             (retry and response.status in FAILED_STATUSES))
+                if not retriable or attempt >= self.policy.retries:
+                    return response
+                delay = self.policy.delay(attempt, retry_after(response))
+
+            with self.stats.lock:
+                self.stats.retries += 1
+            self.sleep(delay)
+            attempt += 1
+
+
 class Context(object):
-    def __init__(self, server, auth):
+    def __init__(self, server, auth, transport=None, sessions=None, scheduler=None):
         self.server = server
         self.auth = auth
+        self.transport = transport or Transport()
+        self.scheduler = scheduler or Scheduler(self.transport)
+        self.sessions = sessions
+        self.session_key = None
+        self.lock = threading.Lock()
+
+    def session_id(self):
+        return "{}@{}".format(self.auth.username, self.server.api())
+
+    def login(self):
+        """
+        Logs in through the REST API and returns the new session key.
+        """
+        url = urlparse.urljoin(self.server.url(), LOGIN_PATH)
+        # Every login creates a new session, so that it is retry-safe
+        response = self.scheduler.request(
+            Verbs.Post, url,
+            body=urllib.urlencode({"username": self.auth.username,
+                                   "password": self.auth.password}),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            retry=True)
+        if response.status != 200:
+            raise http_error(url, response)
+
+        session_key = ETtree.XML(response.body).findtext("sessionKey")
+        if not session_key:
+            raise ValueError("no session key in the login response")
+        return session_key
+
+    def session(self, expired=None):
+        """
+        Returns the session key, logging in unless a valid one is known.
+        expired is a key rejected by the server, which is never returned.
+        """
+        with self.lock:
+            if self.session_key is not None and self.session_key != expired:
+                return self.session_key
+
+            if self.sessions is not None:
+                session_key = self.sessions.get(self.session_id())
+                if session_key is not None and session_key != expired:
+                    self.session_key = session_key
+                    return session_key
+
+            self.session_key = self.login()
+            if self.sessions is not None:
+                self.sessions.put(self.session_id(), self.session_key)
+            return self.session_key
+
+    def request(self, verb, url, data=None, retry=None):
+        """
+        Sends an authenticated request and returns the response. Raises
+        urllib2.HTTPError on error statuses. A request rejected because the
+        session expired is sent again once logged in. retry tells whether
+        the call is retry-safe, which GET and DELETE calls are by default.
+        """
+        if retry is None:
+            retry = verb in (Verbs.Get, Verbs.Delete)
+
+        headers = {}
+        if data is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        session_key = self.session()
+        headers.update([session_header(session_key)])
+        response = self.scheduler.request(verb, url, data, headers, retry=retry)
+
+        if response.status == 401:
+            headers.update([session_header(self.session(expired=session_key))])
+            response = self.scheduler.request(verb, url, data, headers, retry=retry)
+
+        if response.status >= 400:
+            raise http_error(url, response)
+        return response
 
 
 class Client(object):
-    def __init__(self, server=ServerInfo(), auth=AuthenticationInfo()):
-        self.context = Context(server, auth)
+    def __init__(self, server=ServerInfo(), auth=AuthenticationInfo(),
+                 transport=None, sessions=None, scheduler=None):
+        self.context = Context(server, auth, transport, sessions, scheduler)
+        self._dashboards = DashboardClient(self.context)
+
+    def close(self):
+        self.context.transport.close()
+
+    def stats(self):
+        """
+        Returns the request, retry and latency counters of the client.
+        """
+        return self.context.scheduler.stats.to_dict()
 
     def dashboards(self):
-        return DashboardClient(self.context)
+        return self._dashboards
 
 
 class DashboardClient(object):
+    """
+    Client of the views of the Splunk REST API. Listings of the views of
+    an app, once fetched, are kept up to date by the calls made through
+    this client and answer existence checks without any request.
+    """
     def __init__(self, context):
         self.context = context
+        self.listings = {}
+        self.lock = threading.Lock()
 
     def _resource(self, username, app, dashboard=None):
         resource = urlparse.urljoin(
-            self.context.server.api(),
+            self.context.server.url(),
             "servicesNS/{}/{}/data/ui/views/".format(username, app))
 
         if dashboard is not None:
@@ -65,28 +595,57 @@ class DashboardClient(object):
 
         return resource
 
-    def _request(self, app, dashboard=None, data=None, verb=None):
+    def _request(self, app, dashboard=None, data=None, verb=Verbs.Get, query=None, retry=None):
         context = self.context
         resource = self._resource(context.auth.username, app, dashboard)
-
-        if data is None:
-            req = urllib2.Request(resource)
-        else:
-            req = urllib2.Request(resource, data=data)
-
-        if verb is not None:
-            req.get_method = lambda: verb
-
-        req.add_header(*auth_header(context.auth.username, context.auth.password))
-        return req
+        if query is not None:
+            resource += "?" + urllib.urlencode(query)
+        return context.request(verb, resource, data, retry)
+
+    def _listed(self, app, dashboard, present):
+        with self.lock:
+            listing = self.listings.get(app)
+            if listing is None:
+                return
+            if present:
+                listing.add(dashboard)
+            else:
+                listing.discard(dashboard)
+
+    def views(self, app):
+        """
+        Returns the names of the views of an app, listed in a single
+        request the first time.
+        """
+        with self.lock:
+            if app in self.listings:
+                return frozenset(self.listings[app])
+
+        response = self._request(app, query=[
+            ("count", 0),
+            ("f", "title"),
+            ("search", "eai:acl.app={}".format(app))])
+
+        ns = {'atom': 'http://www.w3.org/2005/Atom'}
+        root = ETtree.XML(response.read())
+        names = set(entry.findtext("atom:title", namespaces=ns)
+                    for entry in root.findall("atom:entry", ns))
+
+        with self.lock:
+            self.listings[app] = names
+        return frozenset(names)
+
+    def invalidate(self, app=None):
+        with self.lock:
+            if app is None:
+                self.listings.clear()
+            else:
+                self.listings.pop(app, None)
 
     def get(self, app, dashboard):
-        req = self._request(app, dashboard, verb=Verbs.Get)
-        response = urllib2.urlopen(req, timeout=60, context=no_ssl_check())
+        response = self._request(app, dashboard)
         raw_data = response.read()
 
-        print raw_data
-
         ns = {'s': 'http://dev.splunk.com/ns/rest'}
         root = ETtree.XML(raw_data)
         dashboard_data = root.find(".//s:key[@name='eai:data']", ns).text.strip()
@@ -94,36 +653,78 @@ class DashboardClient(object):
         return dashboard_data
 
     def exists(self, app, dashboard):
+        cached = self.exists_cached(app, dashboard)
+        if cached is not None:
+            return cached
+
         try:
-            req = self._request(app, dashboard, verb=Verbs.Get)
-            urllib2.urlopen(req, timeout=60, context=no_ssl_check())
+            self._request(app, dashboard)
             return True
         except urllib2.HTTPError as e:
             if e.code == 404:
                 return False
             raise
 
+    def upsert(self, app, dashboard, data):
+        """
+        Creates or updates a dashboard, in a single request unless the
+        listing of the app is out of date. Without a listing, the dashboard
+        is assumed to exist, redeploying being the common case. Returns
+        'created' or 'updated'.
+        """
+        if self.exists_cached(app, dashboard) is False:
+            try:
+                self.create(app, dashboard, data)
+                return "created"
+            except urllib2.HTTPError as e:
+                # Created since the app was listed
+                if e.code != 409:
+                    raise
+
+        try:
+            self.update(app, dashboard, data)
+            return "updated"
+        except urllib2.HTTPError as e:
+            if e.code != 404:
+                raise
+
+        self.create(app, dashboard, data)
+        return "created"
+
+    def exists_cached(self, app, dashboard):
+        """
+        Returns whether the dashboard exists according to the listing of
+        the app, or None if the app was not listed.
+        """
+        with self.lock:
+            listing = self.listings.get(app)
+            if listing is None:
+                return None
+            return dashboard in listing
+
     def create(self, app, dashboard, data):
-        req = self._request(app,
-                            verb=Verbs.Post,
-                            data=urllib.urlencode({
-                                'name': dashboard,
-                                'eai:data': data
-                            }))
-        response = urllib2.urlopen(req, timeout=60, context=no_ssl_check())
-        print response.read()
+        response = self._request(app,
+                                 verb=Verbs.Post,
+                                 data=urllib.urlencode({
+                                     'name': dashboard,
+                                     'eai:data': data
+                                 }))
+        self._listed(app, dashboard, True)
+        return response.read()
 
     def update(self, app, dashboard, data):
-        req = self._request(app,
-                            dashboard,
-                            verb=Verbs.Post,
-                            data=urllib.urlencode({
-                                'eai:data': data
-                            }))
-        response = urllib2.urlopen(req, timeout=60, context=no_ssl_check())
-        print response.read()
+        # Updates set the whole dashboard, so that they are retry-safe
+        response = self._request(app,
+                                 dashboard,
+                                 verb=Verbs.Post,
+                                 data=urllib.urlencode({
+                                     'eai:data': data
+                                 }),
+                                 retry=True)
+        self._listed(app, dashboard, True)
+        return response.read()
 
     def delete(self, app, dashboard):
-        req = self._request(app, dashboard, verb='DELETE')
-        response = urllib2.urlopen(req, timeout=60, context=no_ssl_check())
-        print response.read()
+        response = self._request(app, dashboard, verb=Verbs.Delete)
+        self._listed(app, dashboard, False)
+        return response.read()
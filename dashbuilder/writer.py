@@ -0,0 +1,185 @@
+import cStringIO
+import hashlib
+
+
+def escape(data):
+    return (data.replace("&", "&amp;")
+                .replace("<", "&lt;")
+                .replace("\"", "&quot;")
+                .replace(">", "&gt;"))
+
+
+# Spellings of booleans written by str() and normalized in canonical XML
+BOOLEANS = {"True": "true", "False": "false"}
+
+# Elements whose text holds an option value, which may be a boolean. The
+# text of other elements (titles, queries...) is written as is.
+BOOLEAN_ELEMENTS = frozenset(["option"])
+
+
+def encode(data):
+    if isinstance(data, unicode):
+        return data.encode('utf-8')
+    return str(data)
+
+
+class XmlWriter(object):
+    """
+    Incremental XML writer fed with start/text/end events. Elements are
+    written as soon as possible, with the same layout as minidom's
+    toprettyxml: an element holding a single text node is written on one
+    line, any other content is written on indented lines.
+    """
+    def __init__(self, fp, indent="  ", newl="\n"):
+        self.fp = fp
+        self.indent = indent
+        self.newl = newl
+        self.stack = []
+
+        # Start tag waiting for its closing bracket, and text waiting to
+        # know whether it is the single child of its element
+        self.open_tag = False
+        self.pending_text = None
+
+    def write(self, data):
+        self.fp.write(data)
+
+    def current_indent(self):
+        return self.indent * len(self.stack)
+
+    def start_document(self):
+        self.write('<?xml version="1.0" ?>' + self.newl)
+
+    def end_document(self):
+        if self.stack:
+            raise RuntimeError("unclosed element(s): {}".format(", ".join(self.stack)))
+
+    def flush_content(self):
+        """
+        Called before writing a child element: the parent start tag is
+        closed and any pending text is written on its own line.
+        """
+        if self.open_tag:
+            self.write(">" + self.newl)
+            self.open_tag = False
+
+        if self.pending_text is not None:
+            self.write(escape(self.current_indent() + self.pending_text + self.newl))
+            self.pending_text = None
+
+    def start(self, tag, attrib=None):
+        self.flush_content()
+
+        parts = [self.current_indent(), "<", tag]
+        for name in sorted(attrib or {}):
+            parts.append(' {}="{}"'.format(name, escape(encode(attrib[name]))))
+        self.write("".join(parts))
+
+        self.stack.append(tag)
+        self.open_tag = True
+
+    def text(self, data):
+        if not data:
+            return
+
+        data = encode(data)
+        if self.open_tag:
+            if self.pending_text is None:
+                self.pending_text = data
+            else:
+                self.pending_text += data
+            return
+
+        # Text following a child element
+        self.write(escape(self.current_indent() + data + self.newl))
+
+    def end(self, tag):
+        if not self.stack or self.stack[-1] != tag:
+            raise RuntimeError("mismatched end tag '{}'".format(tag))
+
+        if self.open_tag:
+            self.open_tag = False
+            if self.pending_text is None:
+                self.stack.pop()
+                self.write("/>" + self.newl)
+                return
+
+            text, self.pending_text = self.pending_text, None
+            self.stack.pop()
+            self.write(">" + escape(text) + "</" + tag + ">" + self.newl)
+            return
+
+        self.stack.pop()
+        self.write(self.current_indent() + "</" + tag + ">" + self.newl)
+
+    def element(self, elem):
+        """
+        Writes a complete ElementTree element.
+        """
+        self.start(elem.tag, elem.attrib)
+        self.text(elem.text)
+        for child in elem:
+            self.element(child)
+            self.text(child.tail)
+        self.end(elem.tag)
+
+
+def tostring(elem):
+    """
+    Returns the pretty-printed XML document of an ElementTree element, as
+    minidom's toprettyxml would, in a single pass over the tree.
+    """
+    fp = cStringIO.StringIO()
+    w = XmlWriter(fp)
+    w.start_document()
+    w.element(elem)
+    w.end_document()
+    return fp.getvalue()
+
+
+class MinifiedXmlWriter(XmlWriter):
+    """
+    XmlWriter writing canonical XML: attributes are sorted, text is stripped
+    of its surrounding whitespace, whitespace-only text is dropped, nothing
+    is indented and booleans in attribute values and option elements are
+    written as 'true' and 'false'.
+    """
+    def __init__(self, fp):
+        super(MinifiedXmlWriter, self).__init__(fp, indent="", newl="")
+
+    def start(self, tag, attrib=None):
+        attrib = dict((name, normalize(encode(value)))
+                      for name, value in (attrib or {}).iteritems())
+        super(MinifiedXmlWriter, self).start(tag, attrib)
+
+    def text(self, data):
+        if data:
+            data = encode(data).strip()
+            if self.stack and self.stack[-1] in BOOLEAN_ELEMENTS:
+                data = normalize(data)
+            super(MinifiedXmlWriter, self).text(data)
+
+
+def normalize(value):
+    return BOOLEANS.get(value, value)
+
+
+def minify(elem):
+    """
+    Returns the canonical XML document of an ElementTree element.
+    """
+    fp = cStringIO.StringIO()
+    w = MinifiedXmlWriter(fp)
+    w.start_document()
+    w.element(elem)
+    w.end_document()
+    return fp.getvalue()
+
+
+def content_hash(elem):
+    """
+    Returns the SHA-1 of the canonical XML of an ElementTree element. It
+    does not depend on the layout of the document, so that a dashboard
+    parsed back from its pretty-printed XML has the same hash.
+    """
+    return hashlib.sha1(minify(elem)).hexdigest()
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+import unittest
+
+from dashbuilder import analyzer
+
+
+def chart(query, **search):
+    search['query'] = query
+    return {'chart': {'search': search}}
+
+
+class TestAnalyze(unittest.TestCase):
+    def dashboard(self):
+        return {'form': {
+            'fieldset': {'items': [
+                {'time': {'token': 'picker'}},
+                {'checkbox': {'token': 'hosts'}}]},
+            'rows': [
+                {'panels': [
+                    {'items': [chart('index=main $hosts$',
+                                     earliest='$picker.earliest$',
+                                     latest='$picket.latest$')]},
+                    {'items': [chart('index=main | stats count',
+                                     earliest='$picker.earliest$',
+                                     latest='$picker.latest$')]}]},
+                {'depends': '$hosts$',
+                 'panels': [{'items': [chart('index=other user=$env:user$')]}]}]}}
+
+    def test_unresolved_tokens(self):
+        # Given
+        report = analyzer.analyze(self.dashboard())
+
+        # Then
+        self.assertEquals(report['unresolved'],
+                          [{'token': 'picket.latest',
+                            'search': 'rows[0].panels[0].items[0].chart.search'}])
+
+    def test_searches_per_input_change(self):
+        # Given
+        report = analyzer.analyze(self.dashboard())
+
+        # Then
+        self.assertEquals(report['inputs']['picker'],
+                          {'tokens': ['picker.earliest', 'picker.latest'], 'searches': 2})
+        self.assertEquals(report['inputs']['hosts']['searches'], 2)
+        self.assertEquals(report['on_load'], 2)
+        self.assertEquals(report['max_concurrent_searches'], 2)
+
+    def test_default_time_range(self):
+        # Given
+        data = {'form': {'fieldset': {'items': [{'time': {}}]},
+                         'rows': [{'panels': [{'items': [chart('a', earliest='$earliest$')]}]}]}}
+
+        # Then
+        self.assertEquals(analyzer.analyze(data)['unresolved'], [])
+
+    def test_rejected_tokens_are_not_waited_for(self):
+        # Given
+        data = {'dashboard': {'rows': [
+            {'rejects': '$detail$', 'panels': [{'items': [chart('index=main')]}]}]}}
+
+        # When
+        report = analyzer.analyze(data)
+
+        # Then
+        self.assertEquals(report['unresolved'], [])
+        self.assertEquals(report['on_load'], 1)
+        self.assertEquals(report['tokens'], {'detail': ['rows[0].panels[0].items[0].chart.search']})
+
+    def test_post_process_searches_are_not_jobs(self):
+        # Given
+        data = {'dashboard': {
+            'searches': [{'id': 'base', 'query': 'index=main | stats count by host'}],
+            'rows': [{'panels': [{'items': [chart('| where count > 1', base='base'),
+                                            chart('| sort count', base='base')]}]}]}}
+
+        # When
+        report = analyzer.analyze(data)
+
+        # Then
+        self.assertEquals(report['searches'], 1)
+        self.assertEquals(report['on_load'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+import unittest
+import os
+import shutil
+import tempfile
+
+from dashbuilder import build
+
+
+class TestBuildDirectory(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, 'src')
+        self.output = os.path.join(self.directory, 'out')
+        os.makedirs(os.path.join(self.source, 'team'))
+        self.write('a.yaml', 'a')
+        self.write('team/b.yml', 'b')
+        self.rendered = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        with open(os.path.join(self.source, name), 'w') as fp:
+            fp.write(content)
+
+    def render(self, path):
+        self.rendered.append(os.path.relpath(path, self.source))
+        with open(path) as fp:
+            return '<dashboard>{}</dashboard>'.format(fp.read())
+
+    def test_first_build_renders_everything(self):
+        # Given
+        report = build.build_directory(self.source, self.output, self.render)
+
+        # Then
+        self.assertEquals(sorted(report['built']), ['a.yaml', 'team/b.yml'])
+        self.assertTrue(os.path.exists(os.path.join(self.output, 'team', 'b.xml')))
+        self.assertTrue(os.path.exists(os.path.join(self.output, build.MANIFEST)))
+
+    def test_noop_build_renders_nothing(self):
+        # Given
+        build.build_directory(self.source, self.output, self.render)
+        self.rendered = []
+        report = build.build_directory(self.source, self.output, self.render)
+
+        # Then
+        self.assertEquals(self.rendered, [])
+        self.assertEquals(len(report['skipped']), 2)
+
+    def test_changed_input_is_rebuilt(self):
+        # Given
+        build.build_directory(self.source, self.output, self.render)
+        self.rendered = []
+        self.write('a.yaml', 'changed')
+        build.build_directory(self.source, self.output, self.render)
+
+        # Then
+        self.assertEquals(self.rendered, ['a.yaml'])
+
+    def test_modified_output_is_rebuilt(self):
+        # Given
+        build.build_directory(self.source, self.output, self.render)
+        self.rendered = []
+        with open(os.path.join(self.output, 'a.xml'), 'w') as fp:
+            fp.write('edited')
+        build.build_directory(self.source, self.output, self.render)
+
+        # Then
+        self.assertEquals(self.rendered, ['a.yaml'])
+
+    def test_changed_settings_rebuild_everything(self):
+        # Given
+        build.build_directory(self.source, self.output, self.render, settings={'minify': False})
+        self.rendered = []
+        build.build_directory(self.source, self.output, self.render, settings={'minify': True})
+
+        # Then
+        self.assertEquals(sorted(self.rendered), ['a.yaml', 'team/b.yml'])
+
+    def test_same_settings_render_nothing(self):
+        # Given
+        build.build_directory(self.source, self.output, self.render, settings={'policy': 'x'})
+        self.rendered = []
+        build.build_directory(self.source, self.output, self.render, settings={'policy': 'x'})
+
+        # Then
+        self.assertEquals(self.rendered, [])
+
+    def test_deleted_input_is_removed(self):
+        # Given
+        build.build_directory(self.source, self.output, self.render)
+        os.remove(os.path.join(self.source, 'team', 'b.yml'))
+        report = build.build_directory(self.source, self.output, self.render)
+
+        # Then
+        self.assertEquals(report['removed'], ['team/b.yml'])
+        self.assertFalse(os.path.exists(os.path.join(self.output, 'team', 'b.xml')))
+        self.assertEquals(build.load_manifest(self.output)['dashboards'].keys(), ['a.yaml'])
+        self.assertEquals(build.build_directory(self.source, self.output, self.render)['removed'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,238 @@
+#!/usr/bin/python
+import collections
+import unittest
+import os
+import shutil
+import tempfile
+
+from dashbuilder import dashbuilder
+from tests.test_splunk import SplunkTestCase
+
+
+DASHBOARD = '''dashboard:
+  label: Test
+  rows:
+    - panels:
+        - items:
+            - chart:
+                search:
+                  query: index=main | stats count
+'''
+
+HTML_DASHBOARD = '''dashboard:
+  label: Test
+  rows:
+    - panels:
+        - items:
+            - html:
+                html: <p>worker stats</p>
+'''
+
+
+def write(directory, name, content):
+    path = os.path.join(directory, name)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as fp:
+        fp.write(content)
+    return path
+
+
+class DirectoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        return write(self.directory, name, content)
+
+
+class TestGenerateMany(DirectoryTestCase):
+    def options(self, *args):
+        return dashbuilder.create_argument_parser().parse_args(
+            ['generate', '--no-cache', '-o', os.path.join(self.directory, 'out')] + list(args))
+
+    def test_expand_paths(self):
+        # Given
+        a = self.write('a.yaml', DASHBOARD)
+        b = self.write('b.yaml', DASHBOARD)
+        missing = os.path.join(self.directory, 'missing.yaml')
+
+        # Then
+        self.assertEquals(dashbuilder.expand_paths([os.path.join(self.directory, '*.yaml'), missing]),
+                          [a, b, missing])
+
+    def test_expand_paths_dedupes(self):
+        # Given
+        a = self.write('a.yaml', DASHBOARD)
+        b = self.write('b.yaml', DASHBOARD)
+
+        # Then
+        self.assertEquals(dashbuilder.expand_paths([b, os.path.join(self.directory, '*.yaml'),
+                                                    os.path.join(self.directory, '.', 'a.yaml')]),
+                          [b, a])
+
+    def test_options_are_not_modified(self):
+        # Given
+        a = self.write('a.yaml', DASHBOARD)
+        b = self.write('b.yaml', DASHBOARD)
+        options = self.options('-w', '2', '-j', '3', a, b)
+        os.makedirs(options.output_dir)
+
+        # When
+        results = list(dashbuilder.generate_many([a, b], options))
+
+        # Then
+        self.assertEquals([error for _, error in results], [None, None])
+        self.assertEquals(options.jobs, 3)
+
+    def test_lazy_conflicts(self):
+        # Given
+        options = self.options('--lazy', '--search-budget', '4', '-t', '2', 'a.yaml')
+
+        # Then
+        self.assertEquals(dashbuilder.lazy_conflicts(options), ['--search-budget', '--threads'])
+        self.assertEquals(dashbuilder.lazy_conflicts(self.options('--lazy', 'a.yaml')), [])
+
+    def test_worker_stats_are_merged(self):
+        # Given
+        a = self.write('a.yaml', HTML_DASHBOARD)
+        b = self.write('b.yaml', HTML_DASHBOARD)
+        options = self.options('-w', '2', a, b)
+        os.makedirs(options.output_dir)
+        stats = collections.Counter()
+
+        # When
+        results = list(dashbuilder.generate_many([a, b], options, stats))
+
+        # Then
+        self.assertEquals([error for _, error in results], [None, None])
+        self.assertEquals(stats['hits'] + stats['misses'], 2)
+
+    def test_errors_are_reported_per_file(self):
+        # Given
+        good = self.write('good.yaml', DASHBOARD)
+        bad = self.write('bad.yaml', 'dashboard:\n  rows: [{panels: [{}]}]\n')
+        options = self.options(good, bad)
+        os.makedirs(options.output_dir)
+
+        # When
+        results = dict(dashbuilder.generate_many([good, bad], options))
+
+        # Then
+        self.assertIsNone(results[good])
+        self.assertIn('ValueError', results[bad])
+        self.assertEquals(os.listdir(options.output_dir), ['good.xml'])
+
+    def test_exit_status(self):
+        # Given
+        good = self.write('good.yaml', DASHBOARD)
+        bad = self.write('bad.yaml', 'dashboard:\n  rows: [{panels: [{}]}]\n')
+
+        # Then
+        self.assertEquals(dashbuilder.generate_mode(self.options(good)), 0)
+        self.assertEquals(dashbuilder.generate_mode(self.options(good, bad)), 1)
+
+    def test_duplicate_output_names(self):
+        # Given
+        x = self.write('x/d.yaml', DASHBOARD)
+        y = self.write('y/d.yaml', DASHBOARD)
+        z = self.write('z.yaml', DASHBOARD)
+        options = self.options(x, y, z)
+        os.makedirs(options.output_dir)
+
+        # When
+        results = dict(dashbuilder.generate_many([x, y, z], options))
+
+        # Then
+        self.assertIn('shared', results[x])
+        self.assertIn('shared', results[y])
+        self.assertIsNone(results[z])
+        self.assertEquals(os.listdir(options.output_dir), ['z.xml'])
+
+
+class TestPublish(SplunkTestCase):
+    def write(self, name, content):
+        return write(self.directory, name, content)
+
+    def options(self, *args):
+        settings = self.write('settings.yaml',
+                              'settings:\n  username: admin\n  password: changeme\n'
+                              '  api: http://127.0.0.1\n  port: {}\n'.format(self.server.server_address[1]))
+        return dashbuilder.create_argument_parser().parse_args(
+            ['publish', '-S', settings, '-a', 'search', '--no-session-cache',
+             '--manifest', os.path.join(self.directory, 'manifest.json')] + list(args))
+
+    def test_expand_xml_paths(self):
+        # Given
+        a = self.write('xml/a.xml', '<form/>')
+        b = self.write('xml/b.xml', '<form/>')
+        self.write('xml/c.yaml', '')
+        c = self.write('c.xml', '<form/>')
+
+        # Then
+        self.assertEquals(dashbuilder.expand_xml_paths([os.path.join(self.directory, 'xml'), c]),
+                          [a, b, c])
+
+    def test_report(self):
+        # Given
+        self.server.views['updated'] = '<form/>'
+        paths = [self.write('created.xml', '<form/>'),
+                 self.write('updated.xml', '<dashboard/>'),
+                 self.write('invalid.xml', '<form')]
+        client = self.server.client()
+
+        # When
+        results = dict((path, (action, error)) for path, action, error
+                       in dashbuilder.publish_many(client, 'search', paths, jobs=3))
+
+        # Then
+        self.assertEquals(results[paths[0]], ('created', None))
+        self.assertEquals(results[paths[1]], ('updated', None))
+        self.assertEquals(results[paths[2]][0], 'failed')
+        self.assertIn('not valid xml', results[paths[2]][1])
+        self.assertEquals(self.server.views, {'created': '<form/>', 'updated': '<dashboard/>'})
+
+    def test_duplicate_names_are_rejected(self):
+        # Given
+        x = self.write('x/d.xml', '<form/>')
+        y = self.write('y/d.xml', '<dashboard/>')
+        z = self.write('z.xml', '<form/>')
+
+        # When
+        results = dict((path, action) for path, action, _
+                       in dashbuilder.publish_many(self.server.client(), 'search', [x, y, z], jobs=2))
+
+        # Then
+        self.assertEquals(results, {x: 'failed', y: 'failed', z: 'created'})
+        self.assertEquals(self.server.views.keys(), ['z'])
+
+    def test_exit_status(self):
+        # Given
+        good = self.write('good.xml', '<form/>')
+        bad = self.write('bad.xml', '<form')
+
+        # Then
+        self.assertEquals(dashbuilder.publish_mode(self.options(good)), 0)
+        self.assertEquals(dashbuilder.publish_mode(self.options('-j', '2', good, bad)), 1)
+        self.assertEquals(self.server.views, {'good': '<form/>'})
+
+    def test_failed_listing_falls_back_to_upsert(self):
+        # Given
+        self.server.views['old'] = '<form/>'
+        old = self.write('old.xml', '<dashboard/>')
+        new = self.write('new.xml', '<form/>')
+        self.server.statuses = [403]
+
+        # When
+        status = dashbuilder.publish_mode(self.options(old, new))
+
+        # Then
+        self.assertEquals(status, 0)
+        self.assertEquals(self.server.views, {'old': '<dashboard/>', 'new': '<form/>'})
+
+
+if __name__ == '__main__':
+    unittest.main()
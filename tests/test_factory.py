@@ -0,0 +1,187 @@
+#!/usr/bin/python
+import unittest
+import warnings
+import xml.etree.ElementTree as ETtree
+
+from dashbuilder import factory
+
+
+class TestRegistry(unittest.TestCase):
+    def test_factories_are_shared(self):
+        # Given
+        registry = factory.Registry()
+
+        # Then
+        self.assertIs(registry.get(factory.SearchFactory),
+                      registry.get(factory.SearchFactory))
+        self.assertIsNot(registry.get(factory.KVFactory, 'option'),
+                         registry.get(factory.KVFactory, 'choice', 'value'))
+
+    def test_shared_factories_are_frozen(self):
+        # Given
+        search = factory.Registry().get(factory.SearchFactory)
+
+        # Then
+        with self.assertRaises(AttributeError):
+            search.mapper.add_attribute('extra')
+
+    def test_unshared_registry_builds_new_factories(self):
+        # Given
+        registry = factory.Registry(shared=False)
+
+        # Then
+        self.assertIsNot(registry.get(factory.SearchFactory),
+                         registry.get(factory.SearchFactory))
+
+    def test_interpreted_registry_builds_its_own_children(self):
+        # Given
+        registry = factory.Registry(compile=False)
+
+        # When
+        panel = registry.get(factory.PanelFactory)
+        members = dict((m.source, m.factory) for m in panel.mapper.mappers
+                       if hasattr(m, 'source'))
+
+        # Then
+        self.assertIsNone(panel.mapper.compiled)
+        self.assertIs(members['search'], registry.get(factory.SearchFactory))
+        self.assertIsNone(members['search'].mapper.compiled)
+        self.assertIs(members['items'].registry, registry)
+        self.assertIsNotNone(factory.get(factory.SearchFactory).mapper.compiled)
+
+    def test_interpreted_and_compiled_outputs_match(self):
+        # Given
+        data = {'form': {'label': 'l', 'rows': [{'panels': [
+            {'items': [{'chart': {'search': {'query': 'a'},
+                                  'options': {'charting.chart': 'pie'}}}]}]}]}}
+
+        # When
+        compiled = ETtree.tostring(factory.create(data))
+        interpreted = ETtree.tostring(factory.create(data, registry=factory.INTERPRETED))
+
+        # Then
+        self.assertEquals(interpreted, compiled)
+
+
+class TestCreate(unittest.TestCase):
+    def test_panels_share_factories(self):
+        # Given
+        data = {'dashboard': {'rows': [{'panels': [
+            {'items': [{'chart': {'search': {'query': 'a'}}}]},
+            {'items': [{'table': {'search': {'query': 'b'}}}]}]}]}}
+
+        # When
+        dashboard = factory.create(data)
+
+        # Then
+        self.assertEquals([e.text for e in dashboard.iter('query')], ['a', 'b'])
+
+    def test_policy_opt_out_is_ignored(self):
+        # Given
+        data = {'dashboard': {'rows': [{'panels': [
+            {'items': [{'chart': {'search': {'query': 'a', 'policy': False}}}]}]}]}}
+
+        # When
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            dashboard = factory.create(data)
+
+        # Then
+        self.assertEquals([e.tag for e in dashboard.find('.//search')], ['query'])
+
+
+class TestKVFactory(unittest.TestCase):
+    def test_choices_keep_their_value_and_label(self):
+        # Given
+        data = {'checkbox': {'token': 't', 'choices': {'a': 'Alpha'}}}
+
+        # When
+        checkbox = factory.get(factory.Either, factory.Tags.Checkbox)(data)
+
+        # Then
+        self.assertEquals(ETtree.tostring(checkbox.find('choice')),
+                          '<choice value="a">Alpha</choice>')
+
+    def test_options_and_set_tokens(self):
+        # Given
+        option = factory.get(factory.KVFactory, factory.Tags.Option)
+        set_token = factory.get(factory.KVFactory, 'set', 'token')
+
+        # Then
+        self.assertEquals(ETtree.tostring(option(('charting.chart', 'pie'))),
+                          '<option name="charting.chart">pie</option>')
+        self.assertEquals(ETtree.tostring(set_token(('t', '$value$'))),
+                          '<set token="t">$value$</set>')
+
+
+class TestConcurrentCreate(unittest.TestCase):
+    def test_rows_are_assembled_in_order(self):
+        # Given
+        data = {'form': {'label': 'l', 'rows': [
+            {'panels': [{'title': 'row {}'.format(i),
+                         'items': [{'chart': {'search': {'query': str(i)}}}]}]}
+            for i in range(20)]}}
+
+        # When
+        serial = ETtree.tostring(factory.create(data))
+        concurrent = ETtree.tostring(factory.create(data, threads=4))
+
+        # Then
+        self.assertEquals(concurrent, serial)
+
+    def test_render_does_not_store_input(self):
+        # Given
+        search = factory.Registry().get(factory.SearchFactory)
+        search({'query': 'a'})
+
+        # Then
+        self.assertIsNone(search.mapper.input_data)
+
+
+class TestFragmentCache(unittest.TestCase):
+    def test_hits_and_misses(self):
+        # Given
+        cache = factory.FragmentCache(factory.parse_html)
+        cache.get('<p>a</p>')
+        cache.get('<p>a</p>')
+        cache.get('<p>b</p>')
+
+        # Then
+        self.assertEquals(cache.stats(), {'hits': 1, 'misses': 2, 'size': 2})
+
+    def test_copies_are_independent(self):
+        # Given
+        cache = factory.FragmentCache(factory.parse_html)
+        first = cache.get('<p> a </p>')
+        first.attrib['src'] = 'x'
+        first.find('p').text = 'changed'
+        second = cache.get('<p> a </p>')
+
+        # Then
+        self.assertEquals(second.attrib, {})
+        self.assertEquals(second.find('p').text, 'a')
+
+    def test_least_recently_used_is_evicted(self):
+        # Given
+        cache = factory.FragmentCache(factory.parse_html, maxsize=2)
+        cache.get('<p>a</p>')
+        cache.get('<p>b</p>')
+        cache.get('<p>a</p>')
+        cache.get('<p>c</p>')
+
+        # Then
+        self.assertEquals(list(cache.fragments), ['<p>a</p>', '<p>c</p>'])
+
+    def test_html_panels_do_not_share_attributes(self):
+        # Given
+        html = factory.Registry().get(factory.HtmlFactory)
+        first = html({'html': '<p>help</p>', 'src': 'a'})
+        second = html({'html': '<p>help</p>'})
+
+        # Then
+        self.assertEquals(first.attrib, {'src': 'a'})
+        self.assertEquals(second.attrib, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+#!/usr/bin/python
+import unittest
+import os
+
+from dashbuilder import analyzer
+from dashbuilder import layout
+from dashbuilder import loader
+from dashbuilder import parser
+
+TEST_DASHBOARD = os.path.join(os.path.dirname(__file__), 'test1.yaml')
+
+
+def row(searches):
+    return {'panels': [{'items': [{'chart': {'search': {'query': str(i)}}}]}
+                       for i in range(searches)]}
+
+
+class TestLimitConcurrentSearches(unittest.TestCase):
+    def test_group_rows(self):
+        # Given
+        rows = [row(2), row(2), row(1), row(5), row(1)]
+
+        # Then
+        self.assertEquals([len(group) for group in layout.group_rows(rows, 4)],
+                          [2, 1, 1, 1])
+
+    def test_within_budget_is_unchanged(self):
+        # Given
+        data = {'dashboard': {'rows': [row(2), row(2)]}}
+
+        # When
+        result, groups = layout.limit_concurrent_searches(data, 4)
+
+        # Then
+        self.assertEquals(result, data)
+        self.assertEquals(groups, 1)
+
+    def test_rows_and_searches_are_gated(self):
+        # Given
+        data = {'dashboard': {'rows': [row(2), dict(row(2), depends='$x$'), row(2)]}}
+
+        # When
+        result, groups = layout.limit_concurrent_searches(data, 3)
+        form = result['form']
+
+        # Then
+        self.assertEquals(groups, 3)
+        self.assertEquals(form['rows'][1]['depends'], '$x$,$lazy_group_2$')
+        search = form['rows'][2]['panels'][0]['items'][0]['chart']['search']
+        self.assertEquals(search['depends'], '$lazy_group_3$')
+        radio = form['fieldset']['items'][-1]['radio']
+        self.assertEquals(len(radio['change']['conditions']), 3)
+
+    def test_group_tokens_are_resolved(self):
+        # Given
+        data = {'form': {'rows': [row(2), row(2)]}}
+        result, _ = layout.limit_concurrent_searches(data, 2)
+
+        # When
+        report = analyzer.analyze(result)
+
+        # Then
+        self.assertEquals(report['unresolved'], [])
+        self.assertEquals(report['inputs']['lazy_group']['searches'], 2)
+        self.assertEquals(report['on_load'], 2)
+
+    def test_analyzer_checks_budget(self):
+        # Given
+        data = parser.parse(loader.load_yaml_file(TEST_DASHBOARD))
+        result, groups = layout.limit_concurrent_searches(data, 2)
+
+        # When
+        report = analyzer.analyze(result)
+
+        # Then
+        self.assertEquals(groups, 3)
+        self.assertEquals(report['searches'], 6)
+        self.assertEquals(report['inputs']['lazy_group']['searches'], 2)
+        self.assertEquals(report['max_concurrent_searches'], 2)
+
+    def test_dashboard_searches_count_against_budget(self):
+        # Given
+        data = {'dashboard': {'search': {'query': 'index=summary'},
+                              'rows': [row(1), row(1), row(1)]}}
+
+        # When
+        _, groups = layout.limit_concurrent_searches(data, 2)
+
+        # Then
+        self.assertEquals(groups, 3)
+
+    def test_base_searches_are_gated(self):
+        # Given
+        def post_process(base):
+            return {'panels': [{'items': [{'chart': {'search': {'base': base, 'query': '| sort'}}}]}]}
+
+        data = {'dashboard': {
+            'searches': [{'id': 'a', 'query': 'index=a | stats count'},
+                         {'id': 'b', 'query': 'index=b | stats count'}],
+            'rows': [post_process('a'), post_process('b'), post_process('a')]}}
+
+        # When
+        result, groups = layout.limit_concurrent_searches(data, 1)
+        form = result['form']
+
+        # Then
+        self.assertEquals(groups, 3)
+        self.assertEquals([(search['id'], search['depends']) for search in form['searches']],
+                          [('a', '$lazy_group_1$'),
+                           ('b', '$lazy_group_2$'),
+                           ('a_', '$lazy_group_3$')])
+        search = form['rows'][2]['panels'][0]['items'][0]['chart']['search']
+        self.assertEquals(search['base'], 'a_')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+import unittest
+import os
+import shutil
+import tempfile
+
+from dashbuilder import loader
+
+
+class TestLoadYamlFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'dashboard.yaml')
+        self.cache_dir = os.path.join(self.directory, 'cache')
+        with open(self.path, 'w') as fp:
+            fp.write('form:\n  label: &name Test\n  description: *name\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_without_cache(self):
+        # Then
+        self.assertEquals(loader.load_yaml_file(self.path),
+                          {'form': {'label': 'Test', 'description': 'Test'}})
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_cache_is_written_and_read(self):
+        # Given
+        first = loader.load_yaml_file(self.path, self.cache_dir)
+        second = loader.load_yaml_file(self.path, self.cache_dir)
+
+        # Then
+        self.assertEquals(len(os.listdir(self.cache_dir)), 1)
+        self.assertEquals(first, second)
+
+    def test_cache_keyed_by_content(self):
+        # Given
+        loader.load_yaml_file(self.path, self.cache_dir)
+        with open(self.path, 'w') as fp:
+            fp.write('form:\n  label: Other\n')
+
+        # Then
+        self.assertEquals(loader.load_yaml_file(self.path, self.cache_dir),
+                          {'form': {'label': 'Other'}})
+        self.assertEquals(len(os.listdir(self.cache_dir)), 2)
+
+    def test_corrupt_cache_is_ignored(self):
+        # Given
+        loader.load_yaml_file(self.path, self.cache_dir)
+        for name in os.listdir(self.cache_dir):
+            with open(os.path.join(self.cache_dir, name), 'wb') as fp:
+                fp.write('\xff garbage')
+
+        # Then
+        self.assertEquals(loader.load_yaml_file(self.path, self.cache_dir),
+                          {'form': {'label': 'Test', 'description': 'Test'}})
+
+    def test_dates_are_not_cached(self):
+        # Given
+        with open(self.path, 'w') as fp:
+            fp.write('form:\n  label: 2020-01-01\n')
+
+        # When
+        data = loader.load_yaml_file(self.path, self.cache_dir)
+
+        # Then
+        self.assertEquals(str(data['form']['label']), '2020-01-01')
+        self.assertEquals(os.listdir(self.cache_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/python
+import itertools
+import unittest
+import warnings
+import xml.etree.ElementTree as ETtree
+
+from dashbuilder import mapper
+
+
+def search_mapper():
+    return (mapper.Mapper()
+            .add_attribute("id", arity='?')
+            .add_static_attribute("type", "search")
+            .add_attribute("searchWhenChanged", arity='?', default=True)
+            .add_text_member("query")
+            .add_member("options",
+                        arity='*',
+                        factory=lambda kv: ETtree.Element(kv[0])))
+
+
+class TestCompiledMapper(unittest.TestCase):
+    def render(self, data, compiled):
+        m = search_mapper()
+        root = ETtree.Element("search")
+        if compiled:
+            m.compile()(data, root)
+        else:
+            m.map(data).into(root)
+        return ETtree.tostring(root)
+
+    def test_matches_interpreted(self):
+        # Given
+        data = {"id": "s1", "query": "index=main", "options": {"a": 1}}
+
+        # Then
+        self.assertEquals(self.render(data, True), self.render(data, False))
+
+    def test_key_sets(self):
+        # Given
+        m = search_mapper()
+        m.compile()
+
+        # Then
+        self.assertEquals(m.required, frozenset(["query"]))
+        self.assertEquals(m.optional, frozenset(["id", "searchWhenChanged", "options"]))
+
+    def test_missing_required_key_raises(self):
+        # Then
+        with self.assertRaises(ValueError):
+            self.render({"id": "s1"}, True)
+
+    def test_unknown_key_is_reported(self):
+        # Given
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            self.render({"query": "q", "qeury": "q"}, True)
+
+        # Then
+        self.assertEquals(len(caught), 1)
+        self.assertIs(caught[0].category, mapper.UnknownKeyWarning)
+        self.assertIn("qeury", str(caught[0].message))
+
+    def test_frozen_mapper_is_compiled(self):
+        # Given
+        m = search_mapper()
+        m.freeze()
+        root = ETtree.Element("search")
+        m.map({"query": "q"}).into(root)
+
+        # Then
+        self.assertIsNotNone(m.compiled)
+        self.assertEquals(root.find("query").text, "q")
+
+    def test_mapper_frozen_without_compiling(self):
+        # Given
+        m = search_mapper()
+        m.freeze(compile=False)
+
+        # Then
+        self.assertIsNone(m.compiled)
+
+    def test_compiled_mapper_builds_concurrent_members_with_executor(self):
+        # Given
+        class Executor(object):
+            calls = 0
+
+            def imap(self, f, items):
+                Executor.calls += 1
+                return itertools.imap(f, items)
+
+        m = (mapper.Mapper()
+             .add_member("rows", arity='*',
+                         factory=lambda row: ETtree.Element(row),
+                         concurrent=True))
+        m.freeze()
+        root = ETtree.Element("dashboard")
+
+        # When
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            m.render({"rows": ["a", "b"], "rosw": []}, root, Executor())
+
+        # Then
+        self.assertEquals(Executor.calls, 1)
+        self.assertEquals([e.tag for e in root], ["a", "b"])
+        self.assertEquals(len(caught), 1)
+        self.assertIs(caught[0].category, mapper.UnknownKeyWarning)
+
+
+if __name__ == '__main__':
+    unittest.main()
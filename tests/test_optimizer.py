@@ -0,0 +1,94 @@
+#!/usr/bin/python
+import unittest
+
+from dashbuilder import optimizer
+
+
+def panel(query, earliest='-24h'):
+    return {'items': [{'chart': {'search': {'query': query, 'earliest': earliest}}}]}
+
+
+def dashboard(*panels, **options):
+    data = {'rows': [{'panels': list(panels)}]}
+    data.update(options)
+    return {'form': data}
+
+
+def search_of(data, i):
+    return data['form']['rows'][0]['panels'][i]['items'][0]['chart']['search']
+
+
+class TestSplitQuery(unittest.TestCase):
+    def test_split_after_transforming_command(self):
+        # Then
+        self.assertEquals(optimizer.split_query('index=main | stats count by host | sort - count'),
+                          ('index=main | stats count by host', ['sort - count']))
+
+    def test_pipes_in_quotes_are_ignored(self):
+        # Then
+        self.assertEquals(optimizer.split_pipeline('search "a|b" | stats count'),
+                          ['search "a|b"', 'stats count'])
+
+    def test_no_transforming_command(self):
+        # Then
+        self.assertIsNone(optimizer.split_query('index=main | head 10'))
+
+
+class TestConsolidateSearches(unittest.TestCase):
+    def test_disabled_by_default(self):
+        # Given
+        data = dashboard(panel('a | stats count'), panel('a | stats count'))
+
+        # When
+        result, report = optimizer.consolidate_searches(data)
+
+        # Then
+        self.assertEquals(result, data)
+        self.assertEquals(report.removed(), 0)
+
+    def test_duplicates_and_shared_prefixes(self):
+        # Given
+        data = dashboard(panel('a | stats count by host'),
+                         panel('a | stats count by host'),
+                         panel('a | stats count by host | where count > 1'),
+                         panel('a | stats count by host', earliest='-1h'),
+                         consolidateSearches=True)
+
+        # When
+        result, report = optimizer.consolidate_searches(data)
+
+        # Then
+        self.assertEquals(result['form']['searches'],
+                          [{'id': 'base_search_1', 'query': 'a | stats count by host', 'earliest': '-24h'}])
+        self.assertEquals(search_of(result, 0), {'base': 'base_search_1'})
+        self.assertEquals(search_of(result, 2), {'base': 'base_search_1', 'query': '| where count > 1'})
+        self.assertEquals(search_of(result, 3)['query'], 'a | stats count by host')
+        self.assertNotIn('consolidateSearches', result['form'])
+        self.assertEquals(report.removed(), 2)
+
+    def test_raw_event_duplicates_are_kept(self):
+        # Given
+        data = dashboard(panel('index=main error'), panel('index=main error'),
+                         consolidateSearches=True)
+
+        # When
+        result, report = optimizer.consolidate_searches(data)
+
+        # Then
+        self.assertNotIn('searches', result['form'])
+        self.assertEquals(search_of(result, 1)['query'], 'index=main error')
+        self.assertEquals((report.searches, report.removed()), (2, 0))
+
+    def test_input_is_not_modified(self):
+        # Given
+        data = dashboard(panel('a | stats count'), panel('a | stats count'))
+
+        # When
+        optimizer.consolidate_searches(data, force=True)
+
+        # Then
+        self.assertEquals(search_of(data, 0)['query'], 'a | stats count')
+
+
+if __name__ == '__main__':
+    unittest.main()
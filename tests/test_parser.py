@@ -2,6 +2,7 @@
 import unittest
 import sys
 import os
+import types
 
 from dashbuilder import parser
 
@@ -106,6 +107,217 @@ class TestExpandStr(unittest.TestCase):
         with self.assertRaises(RuntimeError):
             parser.expand_str(data, store)
 
+    def test_replace_shared_dependency(self):
+        # Given
+        data = '{value}'
+        store = {'value': '{part1}{part2}',
+                 'part1': '{letter}',
+                 'part2': '{letter}',
+                 'letter': 'a'}
+
+        # Then
+        self.assertEquals(parser.expand_str(data, store), 'aa')
+
+    def test_missing_argument_raises(self):
+        # Given
+        data = 'This is {missing}'
+
+        # Then
+        with self.assertRaises(KeyError):
+            parser.expand_str(data, {})
+
+
+class TestScope(unittest.TestCase):
+    def test_lookup_in_parent(self):
+        # Given
+        scope = parser.Scope({'a': 1}, parser.Scope({'b': {'c': 2}}))
+
+        # Then
+        self.assertEquals(scope['a'], 1)
+        self.assertEquals(scope.lookup('b:c', ['b', 'c']), 2)
+        self.assertTrue('b' in scope)
+        self.assertFalse('z' in scope)
+
+    def test_missing_name_raises(self):
+        # Given
+        scope = parser.Scope({'a': 1}, parser.Scope({}))
+
+        # Then
+        with self.assertRaises(KeyError):
+            scope.lookup('z', ['z'])
+
+    def test_lookup_is_cached(self):
+        # Given
+        scope = parser.Scope({'a': 1})
+        scope.lookup('a', ['a'])
+        scope.values['a'] = 2
+
+        # Then
+        self.assertEquals(scope.lookup('a', ['a']), 1)
+
+    def test_lookup_is_cached_on_owner(self):
+        # Given
+        outer = parser.Scope({'svc': {'sub': 'x'}})
+        parser.Scope({'by': 1}, outer).lookup('svc:sub', ['svc', 'sub'])
+        outer.values['svc'] = {'sub': 'y'}
+
+        # When
+        value = parser.Scope({'by': 2}, outer).lookup('svc:sub', ['svc', 'sub'])
+
+        # Then
+        self.assertEquals(value, 'x')
+        self.assertEquals(outer.cache, {'svc:sub': 'x'})
+
+
+class TestCompileStr(unittest.TestCase):
+    def test_segments(self):
+        # Given
+        template = parser.compile_str('a {b:c} d')
+
+        # Then
+        self.assertEquals(len(template), 3)
+        self.assertEquals(template[0], 'a ')
+        self.assertEquals(template[1].path, ['b', 'c'])
+        self.assertEquals(template[2], ' d')
+
+    def test_cached(self):
+        # Then
+        self.assertIs(parser.compile_str('{x} and {y}'),
+                      parser.compile_str('{x} and {y}'))
+
+    def test_cache_is_bounded(self):
+        # Given
+        cache = parser.TemplateCache(parser.compile_template, maxsize=2)
+        a = cache.get('{a}')
+        cache.get('{b}')
+        cache.get('{a}')
+        cache.get('{c}')
+
+        # Then
+        self.assertEquals(len(cache), 2)
+        self.assertIs(cache.get('{a}'), a)
+        self.assertEquals(sorted(cache.templates), ['{a}', '{c}'])
+
+
+def materialize(data):
+    if isinstance(data, dict):
+        return {k: materialize(v) for k, v in data.iteritems()}
+    if isinstance(data, (list, types.GeneratorType)):
+        return [materialize(item) for item in data]
+    return data
+
+
+class TestParse(unittest.TestCase):
+    def template(self):
+        return {'rows': {'_': {
+            'arguments': {'svc': ['a', 'b']},
+            'body': {'panels': {'_': {
+                'arguments': {'by': ['x', 'y'], 'filter': 'ERROR'},
+                'body': {'title': '{filter} {svc} {by}'}}}}}}}
+
+    def test_expand_template(self):
+        # Given
+        result = parser.parse(self.template())
+
+        # Then
+        self.assertEquals(len(result['rows']), 2)
+        self.assertEquals(result['rows'][1]['panels'][0]['title'], 'ERROR b x')
+
+    def test_lazy_expansion_yields_generators(self):
+        # Given
+        result = parser.parse(self.template(), context=parser.Context(lazy=True))
+
+        # Then
+        self.assertIsInstance(result['rows'], types.GeneratorType)
+        row = next(result['rows'])
+        self.assertIsInstance(row['panels'], types.GeneratorType)
+
+    def test_lazy_expansion_matches_eager(self):
+        # Given
+        eager = parser.parse(self.template())
+        lazy = parser.parse(self.template(), context=parser.Context(lazy=True))
+
+        # Then
+        self.assertEquals(materialize(lazy), eager)
+
+    def test_argument_collision_raises(self):
+        # Given
+        data = {'_': {'arguments': {'a': ['1', '2']},
+                      'body': {'_': {'arguments': {'a': '3'},
+                                     'body': '{a}'}}}}
+
+        # Then
+        with self.assertRaises(KeyError):
+            parser.parse(data)
+
+
+class TestMemoizedParse(unittest.TestCase):
+    def template(self):
+        return {'rows': {'_': {
+            'arguments': {'svc': ['a', 'b'], 'label': '{svc}!'},
+            'body': {'panels': {'_': {
+                'arguments': {'by': ['x', 'y']},
+                'body': {'title': '{label} {by}',
+                         'options': {'charting.chart': 'line'}}}}}}}}
+
+    def test_matches_plain_parse(self):
+        # Given
+        plain = parser.parse(self.template())
+        memoized = parser.parse(self.template(), context=parser.Context(memoize=True))
+
+        # Then
+        self.assertEquals(memoized, plain)
+
+    def test_invariant_subtree_is_shared(self):
+        # Given
+        result = parser.parse(self.template(), context=parser.Context(memoize=True))
+        first = result['rows'][0]['panels'][0]['options']
+        second = result['rows'][1]['panels'][1]['options']
+
+        # Then
+        self.assertIs(first, second)
+
+    def test_indirect_reference_is_not_shared(self):
+        # Given
+        result = parser.parse(self.template(), context=parser.Context(memoize=True))
+
+        # Then
+        self.assertEquals(result['rows'][0]['panels'][0]['title'], 'a! x')
+        self.assertEquals(result['rows'][1]['panels'][0]['title'], 'b! x')
+
+    def test_references(self):
+        # Given
+        analysis = parser.analyze(self.template(), {})
+
+        # Then
+        self.assertEquals(analysis.references, frozenset())
+        self.assertTrue(analysis.has_template)
+
+    def test_lazy_matches_plain_parse(self):
+        # Given
+        plain = parser.parse(self.template())
+        context = parser.Context(lazy=True, memoize=True)
+
+        # Then
+        self.assertEquals(materialize(parser.parse(self.template(), context=context)), plain)
+
+
+class TestParallelParse(unittest.TestCase):
+    def template(self):
+        return {'rows': {'_': {
+            'arguments': {'svc': ['a', 'b', 'c'], 'env': ['dev', 'prod']},
+            'body': {'panels': {'_': {
+                'arguments': {'by': ['x', 'y']},
+                'body': {'title': '{env} {svc} {by}'}}}}}}}
+
+    def test_matches_serial_parse(self):
+        # Given
+        serial = parser.parse(self.template())
+        parallel = parser.parse(self.template(), context=parser.Context(jobs=2))
+
+        # Then
+        self.assertEquals(parallel, serial)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,42 @@
+#!/usr/bin/python
+import unittest
+
+from dashbuilder import planner
+
+
+class TestEstimate(unittest.TestCase):
+    def template(self):
+        return {'form': {'rows': {'_': {
+            'arguments': {'svc': ['a', 'b', 'c']},
+            'body': {'panels': {'_': {
+                'arguments': {'by': ['x', 'y'], 'filter': 'ERROR'},
+                'body': {'title': '{svc}',
+                         'items': [{'chart': {'search': {'query': '{filter}'}}}]}}}}}}}}
+
+    def test_counts_nested_templates(self):
+        # Given
+        estimate = planner.estimate(self.template())
+
+        # Then
+        self.assertEquals(estimate.panels, 6)
+        self.assertEquals(estimate.searches, 6)
+        self.assertTrue(estimate.size > 0)
+
+    def test_limits_within(self):
+        # Given
+        limits = planner.Limits(max_panels=6, max_searches=10)
+
+        # Then
+        planner.check_limits(self.template(), limits)
+
+    def test_limits_exceeded_raises(self):
+        # Given
+        limits = planner.Limits(max_panels=5)
+
+        # Then
+        with self.assertRaises(ValueError):
+            planner.check_limits(self.template(), limits)
+
+
+if __name__ == '__main__':
+    unittest.main()
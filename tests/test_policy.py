@@ -0,0 +1,71 @@
+#!/usr/bin/python
+import unittest
+
+from dashbuilder import policy
+
+
+def dashboard(*searches):
+    return {'form': {'rows': [{'panels': [
+        {'items': [{'chart': {'search': search}}]} for search in searches]}]}}
+
+
+def search_of(data, i):
+    return data['form']['rows'][0]['panels'][i]['items'][0]['chart']['search']
+
+
+class TestDurations(unittest.TestCase):
+    def test_parse_duration(self):
+        # Then
+        self.assertEquals(policy.parse_duration('5m'), 300)
+        self.assertEquals(policy.parse_duration(30), 30)
+        self.assertEquals(policy.parse_duration('30'), 30)
+        self.assertIsNone(policy.parse_duration('$token$'))
+
+    def test_time_range(self):
+        # Then
+        self.assertEquals(policy.time_range({'earliest': '-7d@d'}), 7 * 86400)
+        self.assertEquals(policy.time_range({'earliest': '-2h', 'latest': '-1h'}), 3600)
+        self.assertIsNone(policy.time_range({'earliest': '$picker.earliest$'}))
+
+
+class TestApplyPolicies(unittest.TestCase):
+    def rules(self):
+        return [policy.Rule({'name': 'refresh',
+                             'match': {'panel': 'chart'},
+                             'defaults': {'cache': '300'},
+                             'clamp': {'refresh': {'min': '1m'}}}),
+                policy.Rule({'name': 'sampling',
+                             'match': {'query': 'index=big', 'min_range': '7d'},
+                             'defaults': {'sampleRatio': 10}})]
+
+    def test_defaults_and_clamps(self):
+        # Given
+        data = dashboard({'query': 'index=big', 'earliest': '-30d', 'refresh': '10s'},
+                         {'query': 'index=big', 'earliest': '-1h', 'cache': '60'})
+
+        # When
+        result, changes = policy.apply_policies(data, self.rules())
+
+        # Then
+        self.assertEquals(search_of(result, 0),
+                          {'query': 'index=big', 'earliest': '-30d', 'refresh': '1m',
+                           'cache': '300', 'sampleRatio': 10})
+        self.assertEquals(search_of(result, 1),
+                          {'query': 'index=big', 'earliest': '-1h', 'cache': '60'})
+        self.assertEquals(len(changes), 3)
+
+    def test_opt_out(self):
+        # Given
+        data = dashboard({'query': 'index=big', 'refresh': '10s', 'policy': False})
+
+        # When
+        result, changes = policy.apply_policies(data, self.rules())
+
+        # Then
+        self.assertEquals(search_of(result, 0), {'query': 'index=big', 'refresh': '10s'})
+        self.assertEquals(changes, [])
+        self.assertIn('policy', search_of(data, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
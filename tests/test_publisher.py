@@ -0,0 +1,101 @@
+#!/usr/bin/python
+import unittest
+import os
+
+from dashbuilder import publisher
+from tests.test_splunk import SplunkTestCase
+
+
+PRETTY = '<?xml version="1.0" ?>\n<form>\n  <label>L</label>\n</form>\n'
+MINIFIED = '<form><label>L</label></form>'
+
+
+class TestPublish(SplunkTestCase):
+    def setUp(self):
+        super(TestPublish, self).setUp()
+        self.client = self.server.client()
+        self.manifest = publisher.PublishManifest(os.path.join(self.directory, 'manifest.json'))
+
+    def publish(self, data):
+        return publisher.publish(self.client, 'search', 'd', data,
+                                 manifest=self.manifest, skip_unchanged=True)
+
+    def test_hash_ignores_layout(self):
+        # Then
+        self.assertEquals(publisher.dashboard_hash(PRETTY), publisher.dashboard_hash(MINIFIED))
+
+    def test_unchanged_in_manifest(self):
+        # Given
+        self.assertEquals(self.publish(PRETTY), 'created')
+        del self.server.requests[:]
+
+        # When
+        action = self.publish(MINIFIED)
+
+        # Then
+        self.assertEquals(action, 'unchanged')
+        self.assertEquals(self.server.requests, [])
+
+    def test_deleted_on_server(self):
+        # Given
+        self.publish(PRETTY)
+        del self.server.views['d']
+        self.client = self.server.client()
+        self.client.dashboards().views('search')
+
+        # When
+        action = self.publish(PRETTY)
+
+        # Then
+        self.assertEquals(action, 'created')
+        self.assertIn('d', self.server.views)
+
+    def test_unchanged_on_server(self):
+        # Given
+        self.server.views['d'] = MINIFIED
+
+        # When
+        action = self.publish(PRETTY)
+
+        # Then
+        self.assertEquals(action, 'unchanged')
+        self.assertEquals([verb for verb, _ in self.server.requests], ['POST', 'GET'])
+        self.assertIsNotNone(self.manifest.get(
+            publisher.PublishManifest.key(self.client.context.server.api(), 'search', 'd')))
+
+    def test_non_ascii_unchanged_on_server(self):
+        # Given
+        data = '<form><label>Caf\xc3\xa9</label></form>'
+        self.server.views['d'] = data
+
+        # When
+        action = self.publish(data)
+
+        # Then
+        self.assertEquals(action, 'unchanged')
+
+    def test_changed(self):
+        # Given
+        self.publish(PRETTY)
+
+        # When
+        action = self.publish('<form><label>M</label></form>')
+
+        # Then
+        self.assertEquals(action, 'updated')
+        self.assertEquals(self.server.views['d'], '<form><label>M</label></form>')
+
+    def test_manifest_is_saved(self):
+        # Given
+        self.publish(PRETTY)
+        self.manifest.save()
+
+        # When
+        manifest = publisher.PublishManifest(self.manifest.path)
+
+        # Then
+        self.assertEquals(manifest.entries, self.manifest.entries)
+
+
+if __name__ == '__main__':
+    unittest.main()
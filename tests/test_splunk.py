@@ -0,0 +1,419 @@
+#!/usr/bin/python
+import unittest
+import BaseHTTPServer
+import SocketServer
+import os
+import shutil
+import tempfile
+import socket
+import threading
+import time
+import urllib2
+import urlparse
+
+from dashbuilder import splunk
+
+
+class FakeSplunk(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Minimal Splunk REST API holding views in memory, counting logins,
+    connections and concurrent requests.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), FakeSplunkHandler)
+        self.views = {}
+        self.sessions = set()
+        self.logins = 0
+        self.connections = 0
+        self.requests = []
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        # Statuses returned instead of handling the next requests
+        self.statuses = []
+        # Seconds waited before handling requests
+        self.delay = 0
+        # Close connections after each response, as with idle connections
+        self.close_idle = False
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def client(self, sessions=None, transport=None, scheduler=None):
+        return splunk.Client(splunk.ServerInfo('http://127.0.0.1', self.server_address[1]),
+                             splunk.AuthenticationInfo('admin', 'changeme'),
+                             transport=scheduler.transport if scheduler else transport,
+                             sessions=sessions,
+                             scheduler=scheduler)
+
+
+class FakeSplunkHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def handle_one_request(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            BaseHTTPServer.BaseHTTPRequestHandler.handle_one_request(self)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=''):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if self.server.close_idle:
+            self.close_connection = 1
+
+    def form(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return dict(urlparse.parse_qsl(self.rfile.read(length)))
+
+    def authorized(self):
+        return self.headers.get('Authorization', '').replace('Splunk ', '') in self.server.sessions
+
+    def view(self):
+        path = urlparse.urlsplit(self.path).path
+        return path.rstrip('/').split('/data/ui/views')[-1].lstrip('/') or None
+
+    def injected(self):
+        time.sleep(self.server.delay)
+        if self.server.statuses:
+            self.reply(self.server.statuses.pop(0))
+            return True
+        return False
+
+    def do_GET(self):
+        self.server.requests.append(('GET', self.path))
+        if self.injected():
+            return
+        if not self.authorized():
+            return self.reply(401)
+        name = self.view()
+        if name is None:
+            return self.reply(200, '<feed xmlns="http://www.w3.org/2005/Atom">{}</feed>'.format(
+                ''.join('<entry><title>{}</title></entry>'.format(view)
+                        for view in sorted(self.server.views))))
+        if name not in self.server.views:
+            return self.reply(404)
+        self.reply(200, '<feed xmlns:s="http://dev.splunk.com/ns/rest"><entry><content><s:dict>'
+                        '<s:key name="eai:data">{}</s:key></s:dict></content></entry></feed>'.format(
+                            self.server.views[name].replace('<', '&lt;')))
+
+    def do_POST(self):
+        self.server.requests.append(('POST', self.path))
+        data = self.form()
+        if self.path.endswith('/services/auth/login'):
+            self.server.logins += 1
+            key = 'key{}'.format(self.server.logins)
+            self.server.sessions.add(key)
+            return self.reply(200, '<response><sessionKey>{}</sessionKey></response>'.format(key))
+
+        if self.injected():
+            return
+        if not self.authorized():
+            return self.reply(401)
+
+        name = self.view() or data['name']
+        if self.view() is not None and name not in self.server.views:
+            return self.reply(404)
+        if self.view() is None and name in self.server.views:
+            return self.reply(409)
+        self.server.views[name] = data['eai:data']
+        self.reply(201 if self.view() is None else 200)
+
+
+class SplunkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeSplunk()
+        self.server.start()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+
+class TestClient(SplunkTestCase):
+    def test_connection_and_session_are_reused(self):
+        # Given
+        client = self.server.client()
+        dashboards = client.dashboards()
+
+        # When
+        dashboards.create('search', 'd', '<dashboard/>')
+        dashboards.update('search', 'd', '<form/>')
+        exists = dashboards.exists('search', 'd')
+        client.close()
+
+        # Then
+        self.assertTrue(exists)
+        self.assertEquals(self.server.views, {'d': '<form/>'})
+        self.assertEquals(self.server.logins, 1)
+        self.assertEquals(self.server.connections, 1)
+
+    def test_missing_dashboard(self):
+        # Given
+        dashboards = self.server.client().dashboards()
+
+        # Then
+        self.assertFalse(dashboards.exists('search', 'missing'))
+        with self.assertRaises(urllib2.HTTPError):
+            dashboards.update('search', 'missing', '<form/>')
+
+    def test_session_key_is_cached_on_disk(self):
+        # Given
+        sessions = splunk.SessionCache(os.path.join(self.directory, 'sessions.json'))
+        self.server.client(sessions).dashboards().exists('search', 'd')
+
+        # When
+        self.server.client(sessions).dashboards().exists('search', 'd')
+
+        # Then
+        self.assertEquals(self.server.logins, 1)
+
+    def test_expired_session_logs_in_again(self):
+        # Given
+        sessions = splunk.SessionCache(os.path.join(self.directory, 'sessions.json'))
+        self.server.client(sessions).dashboards().exists('search', 'd')
+        self.server.sessions.clear()
+
+        # When
+        exists = self.server.client(sessions).dashboards().exists('search', 'd')
+
+        # Then
+        self.assertFalse(exists)
+        self.assertEquals(self.server.logins, 2)
+
+    def test_concurrent_requests_per_host_are_bounded(self):
+        # Given
+        client = self.server.client(transport=splunk.Transport(max_per_host=2))
+        threads = [threading.Thread(target=client.dashboards().create,
+                                    args=('search', 'd{}'.format(i), '<form/>'))
+                   for i in range(8)]
+
+        # When
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        client.close()
+
+        # Then
+        self.assertEquals(len(self.server.views), 8)
+        self.assertEquals(self.server.logins, 1)
+        self.assertLessEqual(self.server.max_active, 2)
+        self.assertLessEqual(self.server.connections, 2)
+
+    def test_closed_idle_connection_is_replaced(self):
+        # Given
+        client = self.server.client()
+        self.server.close_idle = True
+        client.dashboards().create('search', 'a', '<form/>')
+
+        # When
+        client.dashboards().create('search', 'b', '<form/>')
+
+        # Then
+        self.assertEquals(sorted(self.server.views), ['a', 'b'])
+        self.assertEquals(self.server.connections, 3)
+
+    def test_timeout_is_not_sent_again(self):
+        # Given
+        client = self.server.client(transport=splunk.Transport(timeout=0.2))
+        client.dashboards().create('search', 'a', '<form/>')
+        self.server.delay = 0.5
+        del self.server.requests[:]
+
+        # Then
+        with self.assertRaises(socket.timeout):
+            client.dashboards().create('search', 'b', '<form/>')
+        self.assertEquals(len(self.server.requests), 1)
+
+
+class TestUpsert(SplunkTestCase):
+    def test_without_listing(self):
+        # Given
+        self.server.views['old'] = '<form/>'
+        dashboards = self.server.client().dashboards()
+
+        # When
+        updated = dashboards.upsert('search', 'old', '<dashboard/>')
+        del self.server.requests[:]
+        created = dashboards.upsert('search', 'new', '<dashboard/>')
+
+        # Then
+        self.assertEquals((updated, created), ('updated', 'created'))
+        self.assertEquals([verb for verb, _ in self.server.requests], ['POST', 'POST'])
+
+    def test_with_listing(self):
+        # Given
+        self.server.views['old'] = '<form/>'
+        dashboards = self.server.client().dashboards()
+        self.assertEquals(dashboards.views('search'), frozenset(['old']))
+        del self.server.requests[:]
+
+        # When
+        actions = [dashboards.upsert('search', name, '<dashboard/>')
+                   for name in ('old', 'new', 'new')]
+
+        # Then
+        self.assertEquals(actions, ['updated', 'created', 'updated'])
+        self.assertEquals(len(self.server.requests), 3)
+        self.assertTrue(dashboards.exists('search', 'new'))
+        self.assertEquals(len(self.server.requests), 3)
+
+    def test_listing_out_of_date(self):
+        # Given
+        dashboards = self.server.client().dashboards()
+        dashboards.views('search')
+        self.server.views['other'] = '<form/>'
+
+        # Then
+        self.assertEquals(dashboards.upsert('search', 'other', '<dashboard/>'), 'updated')
+
+    def test_listing_query(self):
+        # Given
+        dashboards = self.server.client().dashboards()
+
+        # When
+        dashboards.views('search')
+
+        # Then
+        _, path = self.server.requests[-1]
+        query = dict(urlparse.parse_qsl(urlparse.urlsplit(path).query))
+        self.assertEquals(query['count'], '0')
+        self.assertEquals(query['f'], 'title')
+
+
+class TestScheduler(SplunkTestCase):
+    def setUp(self):
+        super(TestScheduler, self).setUp()
+        self.delays = []
+        self.scheduler = splunk.Scheduler(splunk.Transport(), sleep=self.delays.append,
+                                          threshold=3, reset_timeout=3600)
+        self.dashboards = self.server.client(scheduler=self.scheduler).dashboards()
+        self.dashboards.views('search')
+        del self.server.requests[:]
+
+    def test_retry_safe_calls_are_retried(self):
+        # Given
+        self.server.views['d'] = '<form/>'
+        self.server.statuses = [503, 502]
+
+        # When
+        self.dashboards.update('search', 'd', '<dashboard/>')
+
+        # Then
+        self.assertEquals(self.server.views['d'], '<dashboard/>')
+        self.assertEquals(len(self.delays), 2)
+        stats = self.scheduler.stats.to_dict()
+        self.assertEquals((stats['retries'], stats['failures']), (2, 2))
+        self.assertIn('p95', stats['latency'])
+
+    def test_create_is_only_retried_when_rejected(self):
+        # Given
+        self.server.statuses = [503, 502]
+
+        # Then
+        with self.assertRaises(urllib2.HTTPError) as e:
+            self.dashboards.create('search', 'd', '<form/>')
+        self.assertEquals(e.exception.code, 502)
+        self.assertEquals(len(self.server.requests), 2)
+
+    def test_retries_are_bounded(self):
+        # Given
+        self.scheduler.threshold = 10
+        self.scheduler.breakers.clear()
+        self.server.statuses = [500] * 5
+
+        # Then
+        with self.assertRaises(urllib2.HTTPError):
+            self.dashboards.get('search', 'd')
+        self.assertEquals(len(self.server.requests), 4)
+
+    def test_circuit_breaker(self):
+        # Given
+        self.server.statuses = [500] * 3
+        with self.assertRaises(splunk.CircuitOpenError):
+            self.dashboards.update('search', 'd', '<form/>')
+
+        # Then
+        with self.assertRaises(splunk.CircuitOpenError):
+            self.dashboards.get('search', 'd')
+        self.assertEquals(len(self.server.requests), 3)
+        self.assertEquals(self.scheduler.stats.to_dict()['rejected_by_circuit_breaker'], 2)
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate(self):
+        # Given
+        now = [0.0]
+        bucket = splunk.TokenBucket(rate=2, burst=2, clock=lambda: now[0])
+
+        # Then
+        self.assertEquals([bucket.reserve() for _ in range(3)], [0, 0, 0.5])
+        now[0] = 2.0
+        self.assertEquals(bucket.reserve(), 0)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_half_open(self):
+        # Given
+        now = [0.0]
+        breaker = splunk.CircuitBreaker(threshold=1, reset_timeout=10, clock=lambda: now[0])
+        breaker.failure()
+
+        # When
+        now[0] = 11
+        allowed = [breaker.allow(), breaker.allow()]
+        breaker.success()
+
+        # Then
+        self.assertEquals(allowed, [True, False])
+        self.assertTrue(breaker.allow())
+
+
+class TestSessionCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'sessions.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_ttl(self):
+        # Given
+        splunk.SessionCache(self.path).put('admin@host', 'key')
+
+        # Then
+        self.assertEquals(splunk.SessionCache(self.path).get('admin@host'), 'key')
+        self.assertIsNone(splunk.SessionCache(self.path, ttl=-1).get('admin@host'))
+
+    def test_private(self):
+        # Given
+        splunk.SessionCache(self.path).put('admin@host', 'key')
+
+        # Then
+        self.assertEquals(os.stat(self.path).st_mode & 0o077, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
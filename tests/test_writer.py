@@ -0,0 +1,139 @@
+#!/usr/bin/python
+import unittest
+import StringIO
+import xml.dom.minidom as minidom
+import xml.etree.ElementTree as ETtree
+
+from dashbuilder import factory
+from dashbuilder import writer
+
+
+def minidom_pretty(elem):
+    return minidom.parseString(ETtree.tostring(elem, 'utf-8')).toprettyxml(indent="  ")
+
+
+def written(elem):
+    fp = StringIO.StringIO()
+    w = writer.XmlWriter(fp)
+    w.start_document()
+    w.element(elem)
+    w.end_document()
+    return fp.getvalue()
+
+
+class TestXmlWriter(unittest.TestCase):
+    def test_matches_minidom(self):
+        # Given
+        elem = ETtree.XML('<a z="1" b="&quot;x&lt;"><b>text &amp; more</b><c/>'
+                          '<d>lead<e/>tail</d><f></f></a>')
+
+        # Then
+        self.assertEquals(written(elem), minidom_pretty(elem))
+
+    def test_tostring_matches_minidom(self):
+        # Given
+        elem = ETtree.XML('<form><label>L</label><row><panel id="p"/></row></form>')
+
+        # Then
+        self.assertEquals(writer.tostring(elem), minidom_pretty(elem))
+
+    def test_events(self):
+        # Given
+        fp = StringIO.StringIO()
+        w = writer.XmlWriter(fp)
+
+        # When
+        w.start("row", {"id": "r"})
+        w.start("panel")
+        w.text("title")
+        w.end("panel")
+        w.start("panel")
+        w.end("panel")
+        w.end("row")
+
+        # Then
+        self.assertEquals(fp.getvalue(),
+                          '<row id="r">\n  <panel>title</panel>\n  <panel/>\n</row>\n')
+
+    def test_mismatched_end_raises(self):
+        # Given
+        w = writer.XmlWriter(StringIO.StringIO())
+        w.start("row")
+
+        # Then
+        with self.assertRaises(RuntimeError):
+            w.end("panel")
+
+
+class TestStream(unittest.TestCase):
+    def test_matches_element_tree(self):
+        # Given
+        data = {'form': {
+            'label': 'Streamed',
+            'fieldset': {'items': [
+                {'time': {'token': 'picker', 'earliest': '-1h'}},
+                {'checkbox': {'token': 'cb', 'choices': {'a': 'A'}}}]},
+            'rows': [{'id': 'r1', 'panels': [
+                {'title': 'p',
+                 'items': [{'chart': {'options': {'charting.chart': 'line'},
+                                      'search': {'query': 'index=main | stats count'}}},
+                           {'html': {'html': '<p> help </p>'}}]}]}]}}
+        fp = StringIO.StringIO()
+
+        # When
+        factory.stream(data, writer.XmlWriter(fp))
+
+        # Then
+        self.assertEquals(fp.getvalue(), minidom_pretty(factory.create(data)))
+
+
+class TestMinify(unittest.TestCase):
+    def test_canonical(self):
+        # Given
+        elem = ETtree.XML('<form z="1" a="True"><row>\n  <panel> title </panel>'
+                          '<option name="o">False</option>\n</row></form>')
+
+        # Then
+        self.assertEquals(writer.minify(elem),
+                          '<?xml version="1.0" ?><form a="true" z="1"><row>'
+                          '<panel>title</panel><option name="o">false</option></row></form>')
+
+    def test_text_is_not_normalized_outside_options(self):
+        # Given
+        elem = ETtree.XML('<form><label>True</label><search><query>False</query></search></form>')
+
+        # Then
+        self.assertEquals(writer.minify(elem),
+                          '<?xml version="1.0" ?><form><label>True</label>'
+                          '<search><query>False</query></search></form>')
+
+    def test_hash_ignores_layout(self):
+        # Given
+        elem = factory.create({'form': {
+            'label': 'Hashed',
+            'fieldset': {'items': [{'checkbox': {'token': 'cb', 'choices': {'a': 'A'}}}]},
+            'rows': [{'panels': [{'items': [{'chart': {
+                'search': {'query': 'index=main | stats count'}}}]}]}]}})
+
+        # When
+        reparsed = ETtree.fromstring(writer.tostring(elem))
+
+        # Then
+        self.assertEquals(writer.content_hash(reparsed), writer.content_hash(elem))
+
+    def test_stream_matches_minify(self):
+        # Given
+        data = {'dashboard': {'label': 'Streamed',
+                              'rows': [{'panels': [{'title': 'p', 'items': [
+                                  {'single': {'search': {'query': 'index=main | stats count'}}}]}]}]}}
+        fp = StringIO.StringIO()
+
+        # When
+        factory.stream(data, writer.MinifiedXmlWriter(fp))
+
+        # Then
+        self.assertEquals(fp.getvalue(), writer.minify(factory.create(data)))
+
+
+if __name__ == '__main__':
+    unittest.main()